@@ -1,5 +1,6 @@
 import os
 
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
@@ -21,14 +22,85 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+# Load the face recognition model when the process starts rather than on the first frame
+app.config["FACE_MODEL_WARMUP"] = os.environ.get("FACE_MODEL_WARMUP", "1") == "1"
+# Embedding backend: "torch", "torchscript" or "onnx" (optionally int8-quantized)
+app.config["FACE_EMBEDDER_BACKEND"] = os.environ.get("FACE_EMBEDDER_BACKEND", "torch")
+app.config["FACE_EMBEDDER_QUANTIZE"] = os.environ.get("FACE_EMBEDDER_QUANTIZE", "0") == "1"
+app.config["FACE_MODEL_CACHE_DIR"] = os.environ.get("FACE_MODEL_CACHE_DIR", "model_cache")
+# Embedding backbone ("resnet50", "resnet18", "mobilenet_v3_large", "mobilenet_v3_small") and
+# optional PCA dimension (0 = off; fit it with `flask fit-projection`). Changing either
+# re-embeds the gallery in the background on the next start.
+app.config["FACE_BACKBONE"] = os.environ.get("FACE_BACKBONE", "resnet50")
+app.config["FACE_EMBEDDING_DIM"] = int(os.environ.get("FACE_EMBEDDING_DIM", "0"))
+app.config["FACE_MATCH_THRESHOLD"] = float(os.environ.get("FACE_MATCH_THRESHOLD", "0.4"))
+app.config["FACE_MATCH_TOP_K"] = int(os.environ.get("FACE_MATCH_TOP_K", "5"))
+app.config["FACE_EMBED_BATCH_SIZE"] = int(os.environ.get("FACE_EMBED_BATCH_SIZE", "32"))
+# Micro-batch face crops from concurrent requests into shared forward passes
+app.config["FACE_BATCH_SCHEDULER"] = os.environ.get("FACE_BATCH_SCHEDULER", "1") == "1"
+app.config["FACE_BATCH_MAX_WAIT_MS"] = float(os.environ.get("FACE_BATCH_MAX_WAIT_MS", "5"))
+# Align face crops using the 68-point landmark model when it is available
+app.config["FACE_ALIGN"] = os.environ.get("FACE_ALIGN", "1") == "1"
+# Detection resolution: frames are resized by this factor before the HOG pass
+app.config["FACE_DETECTION_SCALE"] = float(os.environ.get("FACE_DETECTION_SCALE", "1.0"))
+app.config["FACE_DETECTION_UPSAMPLE"] = int(os.environ.get("FACE_DETECTION_UPSAMPLE", "0"))
+# "process" runs HOG detection on bands of the frame in a shared-memory process pool
+app.config["FACE_DETECTION_BACKEND"] = os.environ.get("FACE_DETECTION_BACKEND", "inline")
+app.config["FACE_DETECTION_PROCESSES"] = int(os.environ.get("FACE_DETECTION_PROCESSES", "0"))
+# Tallest face expected in a frame (fraction of its height); bands overlap by this much
+app.config["FACE_DETECTION_MAX_FACE"] = float(os.environ.get("FACE_DETECTION_MAX_FACE", "0.5"))
+# Track faces across the frames of a recognition session and reuse their identities
+app.config["FACE_TRACKING"] = os.environ.get("FACE_TRACKING", "1") == "1"
+app.config["FACE_TRACK_REVERIFY_FRAMES"] = int(os.environ.get("FACE_TRACK_REVERIFY_FRAMES", "30"))
+# Skip recognition when a session's frame has not changed materially
+app.config["FACE_FRAME_GATE"] = os.environ.get("FACE_FRAME_GATE", "1") == "1"
+app.config["FACE_FRAME_GATE_THRESHOLD"] = float(os.environ.get("FACE_FRAME_GATE_THRESHOLD", "4.0"))
+app.config["FACE_FRAME_GATE_MAX_SKIPS"] = int(os.environ.get("FACE_FRAME_GATE_MAX_SKIPS", "10"))
+# Recognition job queue: worker threads, per-session/global bounds and how long requests wait
+app.config["RECOGNITION_WORKERS"] = int(os.environ.get("RECOGNITION_WORKERS", "2"))
+app.config["RECOGNITION_QUEUE_PER_SESSION"] = int(os.environ.get("RECOGNITION_QUEUE_PER_SESSION", "2"))
+app.config["RECOGNITION_QUEUE_MAX"] = int(os.environ.get("RECOGNITION_QUEUE_MAX", "64"))
+# Kept short so request threads are released quickly; slower jobs are polled
+app.config["RECOGNITION_WAIT_SECONDS"] = float(os.environ.get("RECOGNITION_WAIT_SECONDS", "1"))
+# Open streaming sessions; each holds a server thread, so keep this below the gunicorn thread count
+app.config["RECOGNITION_MAX_STREAMS"] = int(os.environ.get("RECOGNITION_MAX_STREAMS", "16"))
+# Approximate nearest-neighbour search: "exact", "ivf", or "auto" (IVF for large galleries)
+app.config["FACE_INDEX"] = os.environ.get("FACE_INDEX", "auto")
+app.config["FACE_INDEX_MIN_SIZE"] = int(os.environ.get("FACE_INDEX_MIN_SIZE", "5000"))
+app.config["FACE_INDEX_NLISTS"] = int(os.environ.get("FACE_INDEX_NLISTS", "0"))
+app.config["FACE_INDEX_NPROBE"] = int(os.environ.get("FACE_INDEX_NPROBE", "8"))
+# Monthly columnar attendance archives written by `flask archive-attendance`
+app.config["ATTENDANCE_ARCHIVE_DIR"] = os.environ.get("ATTENDANCE_ARCHIVE_DIR", "attendance_archive")
 # initialize the app with the extension, flask-sqlalchemy >= 3.0.x
 db.init_app(app)
 
 with app.app_context():
     # Make sure to import the models here or their tables won't be created
     import models  # noqa: F401
+    from migrations import upgrade_schema
 
     db.create_all()
+    # Bring databases created by older versions up to date
+    upgrade_schema(db)
 
 # Import routes after initializing app to avoid circular imports
-from routes import *  # noqa: E402, F401
\ No newline at end of file
+from routes import *  # noqa: E402, F401
+
+
+
+def serving_requests():
+    """False when the app is imported by a flask CLI command other than `flask run`."""
+    if os.environ.get("FLASK_RUN_FROM_CLI") != "true":
+        return True
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and ctx.info_name == "run"
+
+
+# Warm up the shared face recognizer once per serving process. CLI commands
+# (upgrade-db, embed-gallery, ...) load the model on demand and must not start
+# the background re-embedding, which would race their own work.
+if app.config["FACE_MODEL_WARMUP"] and serving_requests():
+    from face_recognizer import warm_up  # noqa: E402
+
+    with app.app_context():
+        warm_up(db)
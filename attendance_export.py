@@ -0,0 +1,225 @@
+"""
+Attendance export builders that do not depend on the web app.
+
+The Excel export is a students x dates matrix of check-in times. It is
+built with one pivot over the queried rows and written with a write-only
+openpyxl workbook; check-in cells share a single interned alignment style.
+
+The columnar exports write typed record batches (date32, time64,
+dictionary-encoded student ids and statuses) as Parquet row groups or as
+an uncompressed Arrow IPC file that readers can memory-map. PyArrow is
+optional and only imported when a columnar format is used.
+"""
+import os
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+
+def attendance_matrix(rows, student_ids, start_date, end_date):
+    """Pivot (student id, date, time in) rows into a students x dates DataFrame.
+
+    Every student and every date of the range gets a row/column; cells
+    without a check-in are None.
+    """
+    dates = pd.date_range(start=start_date, end=end_date, freq='D')
+    frame = pd.DataFrame(rows, columns=['student_id', 'date', 'time_in'])
+    frame['time_in'] = [t.strftime('%H:%M:%S') if t else None for t in frame['time_in']]
+    matrix = frame.pivot(index='student_id', columns='date', values='time_in')
+    # Columns are still date objects here; only the header is formatted as text
+    matrix = matrix.reindex(index=pd.Index(student_ids, name='student_id'), columns=dates.date)
+    matrix.columns = dates.strftime('%Y-%m-%d')
+    return matrix.astype(object).where(matrix.notna(), None)
+
+
+def write_attendance_workbook(matrix, output=None):
+    """Write an attendance matrix to an .xlsx file-like object and return it."""
+    output = output or BytesIO()
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Attendance')
+
+    # Column widths are set once per column; a column's default style does not
+    # apply to written cells, so check-in times are styled cells sharing one alignment
+    centered = Alignment(horizontal='center')
+    worksheet.column_dimensions['A'].width = 15
+    for idx in range(len(matrix.columns)):
+        worksheet.column_dimensions[get_column_letter(idx + 2)].width = 12
+
+    header = []
+    for value in ['Student ID', *matrix.columns]:
+        cell = WriteOnlyCell(worksheet, value)
+        cell.font = Font(bold=True)
+        cell.alignment = centered
+        header.append(cell)
+    worksheet.append(header)
+
+    def centered_cell(value):
+        cell = WriteOnlyCell(worksheet, value)
+        cell.alignment = centered
+        return cell
+
+    for student_id, values in zip(matrix.index, matrix.itertuples(index=False, name=None)):
+        worksheet.append([student_id, *(None if value is None else centered_cell(value) for value in values)])
+
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+# Statuses are dictionary-encoded against this fixed dictionary
+STATUSES = ['Present', 'Late', 'Absent']
+
+COLUMNAR_FORMATS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Parquet/Arrow exports require the pyarrow package") from e
+    return pyarrow
+
+
+def attendance_schema():
+    pa = _pyarrow()
+    return pa.schema([
+        ('date', pa.date32()),
+        ('student_id', pa.dictionary(pa.int32(), pa.string())),
+        ('student_name', pa.dictionary(pa.int32(), pa.string())),
+        ('status', pa.dictionary(pa.int8(), pa.string())),
+        ('time_in', pa.time64('us')),
+        ('time_out', pa.time64('us')),
+        ('notes', pa.string()),
+    ])
+
+
+def attendance_record_batches(roster, row_chunks):
+    """Turn chunks of attendance rows into Arrow record batches.
+
+    ``roster`` holds (primary key, student id, name) for every student and
+    fixes the dictionaries, so all batches share them (the Arrow IPC file
+    format does not allow replacing a dictionary). ``row_chunks`` yields
+    lists of (primary key, date, status, time in, time out, notes) rows.
+    """
+    pa = _pyarrow()
+    schema = attendance_schema()
+    positions = {pk: i for i, (pk, _, _) in enumerate(roster)}
+    student_ids = pa.array([student_id for _, student_id, _ in roster], pa.string())
+    names = sorted({name for _, _, name in roster})
+    name_positions = {name: i for i, name in enumerate(names)}
+    name_indices = [name_positions[name] for _, _, name in roster]
+    names = pa.array(names, pa.string())
+    statuses = pa.array(STATUSES, pa.string())
+    status_codes = {status: i for i, status in enumerate(STATUSES)}
+
+    def batches():
+        for rows in row_chunks:
+            if not rows:
+                continue
+            pks, dates, status_values, times_in, times_out, notes = zip(*rows)
+            student_indices = [positions[pk] for pk in pks]
+            yield pa.RecordBatch.from_arrays([
+                pa.array(dates, pa.date32()),
+                pa.DictionaryArray.from_arrays(pa.array(student_indices, pa.int32()), student_ids),
+                pa.DictionaryArray.from_arrays(pa.array([name_indices[i] for i in student_indices], pa.int32()),
+                                               names),
+                pa.DictionaryArray.from_arrays(pa.array([status_codes.get(s) for s in status_values], pa.int8()),
+                                               statuses),
+                pa.array(times_in, pa.time64('us')),
+                pa.array(times_out, pa.time64('us')),
+                pa.array(notes, pa.string()),
+            ], schema=schema)
+
+    # Set up eagerly, so a missing pyarrow surfaces before any output is produced
+    return batches()
+
+
+def _columnar_writer(sink, export_format):
+    pa = _pyarrow()
+    if export_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(sink, attendance_schema(), compression='zstd')
+    if export_format == 'arrow':
+        # Uncompressed, so readers can memory-map the file
+        return pa.ipc.new_file(sink, attendance_schema())
+    raise ValueError(f"Unknown columnar format: {export_format}")
+
+
+class _DrainableSink:
+    """Write-only file object whose buffered bytes can be taken out as they are written."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_attendance_columnar(batches, export_format):
+    """Yield a Parquet or Arrow IPC file as it is written, one row group/batch at a time."""
+    sink = _DrainableSink()
+    writer = _columnar_writer(sink, export_format)
+    for batch in batches:
+        writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def write_attendance_columnar(batches, path, export_format='arrow'):
+    """Write batches to a Parquet or Arrow IPC file, replacing it atomically; returns the row count."""
+    pa = _pyarrow()
+    rows = 0
+    partial = path + '.partial'
+    with pa.OSFile(partial, 'wb') as sink:
+        writer = _columnar_writer(sink, export_format)
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+        writer.close()
+    os.replace(partial, path)
+    return rows
+
+
+def write_log_parquet(frame, path, row_group_size=65536):
+    """Write desktop attendance logs (Student ID, Name, Date, Time columns) as typed Parquet."""
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+    table = pa.table({
+        'date': pa.array(pd.to_datetime(frame['Date']).dt.date, pa.date32()),
+        'student_id': pa.array(frame['Student ID'].astype(str), pa.string()).dictionary_encode(),
+        'student_name': pa.array(frame['Name'].astype(str), pa.string()).dictionary_encode(),
+        'time_in': pa.array(pd.to_datetime(frame['Time'], format='%H:%M:%S').dt.time, pa.time64('us')),
+    })
+    pq.write_table(table, path, row_group_size=row_group_size, compression='zstd')
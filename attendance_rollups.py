@@ -0,0 +1,118 @@
+"""
+Incrementally maintained attendance rollups.
+
+StudentAttendanceSummary and DailyAttendanceSummary hold per-student and
+per-day counts by status, so reports read one row per student or day
+instead of scanning attendance history. Every write to Attendance reports
+its status changes through ``record_changes`` in the same transaction,
+having read the replaced statuses with SELECT ... FOR UPDATE so that
+concurrent writes to one record cannot both subtract the same old status
+(SQLite serializes writers instead). ``rebuild`` recomputes both tables
+from scratch.
+"""
+from collections import defaultdict
+
+from sqlalchemy import case, delete, func, insert, select, update
+
+from app import db
+from models import Attendance, DailyAttendanceSummary, StudentAttendanceSummary
+
+# Status -> rollup column; every record also counts towards 'total'
+STATUS_COLUMNS = {'Present': 'present', 'Late': 'late', 'Absent': 'absent'}
+COUNT_COLUMNS = ('total', 'present', 'late', 'absent')
+
+
+def dialect_insert(model):
+    """INSERT supporting ON CONFLICT for SQLite and PostgreSQL, or None on other databases."""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        return postgresql_insert(model)
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(model)
+    return None
+
+
+def _apply_deltas(model, key, deltas):
+    """Add per-key count deltas to a rollup table, creating missing rows."""
+    rows = [dict({key: value}, **{column: counts.get(column, 0) for column in COUNT_COLUMNS})
+            for value, counts in deltas.items() if any(counts.values())]
+    if not rows:
+        return
+    stmt = dialect_insert(model)
+    if stmt is not None:
+        # One statement for all keys: insert the deltas, or add them to the existing row
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={column: getattr(model, column) + getattr(stmt.excluded, column) for column in COUNT_COLUMNS}
+        )
+        db.session.execute(stmt, rows)
+        return
+    for row in rows:
+        result = db.session.execute(
+            update(model).where(getattr(model, key) == row[key])
+            .values({column: getattr(model, column) + row[column] for column in COUNT_COLUMNS})
+        )
+        if result.rowcount == 0:
+            db.session.execute(insert(model), [row])
+
+
+def record_changes(changes):
+    """Apply attendance status changes to the rollups; the caller commits.
+
+    ``changes`` holds (student_id, date, old_status, new_status) tuples,
+    with None as old_status for a new record and as new_status for a
+    deleted one.
+    """
+    per_student = defaultdict(lambda: defaultdict(int))
+    per_day = defaultdict(lambda: defaultdict(int))
+    for student_id, date, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            if status is None:
+                continue
+            for counts in (per_student[student_id], per_day[date]):
+                counts['total'] += sign
+                if status in STATUS_COLUMNS:
+                    counts[STATUS_COLUMNS[status]] += sign
+    _apply_deltas(StudentAttendanceSummary, 'student_id', per_student)
+    _apply_deltas(DailyAttendanceSummary, 'date', per_day)
+
+
+def forget_student(student_id):
+    """Remove a student's records from the rollups before they are deleted; the caller commits."""
+    records = db.session.query(Attendance.date, Attendance.status).filter(Attendance.student_id == student_id) \
+        .with_for_update().all()
+    record_changes([(student_id, date, status, None) for date, status in records])
+    db.session.execute(delete(StudentAttendanceSummary).where(StudentAttendanceSummary.student_id == student_id))
+
+
+def _counts_by(column):
+    """SELECT of the rollup counts of Attendance grouped by one column."""
+    return select(
+        column,
+        func.count(Attendance.id),
+        *[func.sum(case((Attendance.status == status, 1), else_=0))
+          for status in STATUS_COLUMNS]
+    ).group_by(column)
+
+
+def rebuild():
+    """Recompute both rollup tables from the attendance records and commit."""
+    db.session.execute(delete(StudentAttendanceSummary))
+    db.session.execute(delete(DailyAttendanceSummary))
+    db.session.execute(insert(StudentAttendanceSummary).from_select(
+        ['student_id', *COUNT_COLUMNS], _counts_by(Attendance.student_id)))
+    db.session.execute(insert(DailyAttendanceSummary).from_select(
+        ['date', *COUNT_COLUMNS], _counts_by(Attendance.date)))
+    db.session.commit()
+
+
+def rebuild_if_missing():
+    """Backfill the rollups of a database that has attendance records but no rollups yet."""
+    if db.session.query(DailyAttendanceSummary.date).first() is None \
+            and db.session.query(Attendance.id).first() is not None:
+        rebuild()
+        print("Built attendance rollups from existing records")
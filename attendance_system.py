@@ -9,7 +9,8 @@ from tkinter import messagebox
 import cv2
 import pandas as pd
 
-from face_recognizer import FaceRecognizer
+from face_recognizer import get_face_recognizer
+from frame_gate import FrameGate
 from database import Database
 from gui import AttendanceGUI
 from utils import get_current_datetime, format_time
@@ -19,13 +20,17 @@ class AttendanceSystem:
         """Initialize the attendance system with all components."""
         self.root = root
         self.db = Database()
-        self.face_recognizer = FaceRecognizer(self.db)
+        self.face_recognizer = get_face_recognizer(self.db)
         self.gui = AttendanceGUI(root, self)
 
         # Camera setup
         self.camera = None
         self.is_camera_running = False
 
+        # Skip recognition on frames that match the last processed one
+        self.frame_gate = FrameGate()
+        self.last_recognized_faces = []
+
         # Current session
         self.current_attendance = {}
         self.current_date = datetime.datetime.now().strftime("%Y-%m-%d")
@@ -88,11 +93,14 @@ class AttendanceSystem:
 
         ret, frame = self.camera.read()
         if ret:
-            # Perform face recognition
-            recognized_faces = self.face_recognizer.recognize_faces(frame)
+            # Perform face recognition only when the scene has changed
+            if self.frame_gate.has_changed(frame):
+                self.last_recognized_faces = self.face_recognizer.recognize_faces(frame)
+            recognized_faces = self.last_recognized_faces
 
             # Mark attendance for recognized faces
-            for student_id, student_name in recognized_faces:
+            for face in recognized_faces:
+                student_id, student_name = face['student_id'], face['name']
                 if student_id not in self.current_attendance:
                     current_time = get_current_datetime()
                     self.mark_attendance(student_id, student_name, current_time)
@@ -231,8 +239,8 @@ class AttendanceSystem:
             messagebox.showerror("Error", f"Failed to delete student: {str(e)}")
             return False
 
-    def export_attendance(self, start_date, end_date):
-        """Export attendance data for a date range to a CSV file."""
+    def export_attendance(self, start_date, end_date, export_format='csv'):
+        """Export attendance data for a date range to a CSV or Parquet file."""
         try:
             # Convert string dates to datetime objects
             start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
@@ -264,9 +272,15 @@ class AttendanceSystem:
             # Combine all data
             combined_df = pd.concat(all_data, ignore_index=True)
 
-            # Export to CSV
-            export_filename = f"attendance_logs/export_{start_date}_to_{end_date}.csv"
-            combined_df.to_csv(export_filename, index=False)
+            if export_format == 'parquet':
+                # Typed, columnar export for analytics tools
+                from attendance_export import write_log_parquet
+                export_filename = f"attendance_logs/export_{start_date}_to_{end_date}.parquet"
+                write_log_parquet(combined_df, export_filename)
+            else:
+                # Export to CSV
+                export_filename = f"attendance_logs/export_{start_date}_to_{end_date}.csv"
+                combined_df.to_csv(export_filename, index=False)
 
             messagebox.showinfo("Success", f"Attendance data exported to {export_filename}")
             return True
@@ -0,0 +1,83 @@
+"""
+Recall and latency of the IVF face index against exact gallery search.
+
+Uses a synthetic clustered gallery by default, or the real embeddings of the
+current model with --from-db. Run from the project root:
+
+    python benchmarks/ann_recall.py --size 20000 --nprobe 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_gallery import Gallery  # noqa: E402
+from face_index import IVFIndex  # noqa: E402
+
+
+def synthetic_gallery(size, dim, seed=0):
+    """Gallery of clustered random embeddings plus noisy queries of known students."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, size // 50), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=size)] + 0.6 * rng.normal(size=(size, dim)).astype(np.float32)
+    return Gallery(np.arange(1, size + 1), [f"student {i}" for i in range(1, size + 1)], vectors)
+
+
+def database_gallery():
+    """Gallery loaded from the face_embedding table of the configured database."""
+    from app import app, db
+    from face_recognizer import get_face_recognizer
+
+    with app.app_context():
+        return get_face_recognizer(db).get_gallery()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=2048)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--nlists', type=int, default=0)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--from-db', action='store_true')
+    args = parser.parse_args()
+
+    gallery = database_gallery() if args.from_db else synthetic_gallery(args.size, args.dim)
+    if not len(gallery):
+        print("Gallery is empty")
+        return
+
+    rng = np.random.default_rng(1)
+    rows = rng.integers(len(gallery), size=args.queries)
+    queries = gallery.matrix[rows] + 0.05 * rng.normal(size=(args.queries, gallery.dimension)).astype(np.float32)
+
+    start = time.perf_counter()
+    exact_rows, _ = gallery.search(queries, args.top_k)
+    exact_time = time.perf_counter() - start
+    exact_ids = gallery.student_ids[exact_rows]
+    print(f"gallery={len(gallery)} dim={gallery.dimension} queries={args.queries}")
+    print(f"exact: {exact_time / args.queries * 1000:.3f} ms/query")
+
+    index = IVFIndex(n_lists=args.nlists or None)
+    start = time.perf_counter()
+    index.train(gallery.student_ids, gallery.matrix)
+    print(f"ivf: trained {len(index.centroids)} lists in {time.perf_counter() - start:.2f} s")
+
+    for n_probe in args.nprobe:
+        index.n_probe = n_probe
+        start = time.perf_counter()
+        ann_ids, _ = index.search(queries, args.top_k)
+        ann_time = time.perf_counter() - start
+        recall_1 = np.mean(ann_ids[:, 0] == exact_ids[:, 0])
+        recall_k = np.mean([len(set(a) & set(e)) / args.top_k for a, e in zip(ann_ids, exact_ids)])
+        print(f"nprobe={n_probe:3d}: {ann_time / args.queries * 1000:.3f} ms/query, "
+              f"recall@1={recall_1:.3f}, recall@{args.top_k}={recall_k:.3f}")
+
+
+if __name__ == '__main__':
+    main()
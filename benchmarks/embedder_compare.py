@@ -0,0 +1,111 @@
+"""
+Accuracy and latency of the embedder backends against eager PyTorch.
+
+Embeds the face of every image in student_images with each backend, then
+matches perturbed copies (mirrored, brightened) against each backend's own
+gallery and reports whether the matches are identical to eager PyTorch.
+Run from the project root:
+
+    python benchmarks/embedder_compare.py --backends torch torchscript onnx onnx-int8
+    python benchmarks/embedder_compare.py --backbone mobilenet_v3_small
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_gallery import Gallery  # noqa: E402
+
+
+def load_face_crops(image_dir, recognizer):
+    """Detect the largest face in each image and return (names, crops)."""
+    names, crops = [], []
+    for filename in sorted(os.listdir(image_dir)):
+        image = cv2.imread(os.path.join(image_dir, filename))
+        if image is None:
+            continue
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        faces = recognizer.detect_faces(rgb)
+        if not faces:
+            continue
+        face = max(faces, key=lambda f: f.area())
+        names.append(filename)
+        crops.append(recognizer.get_face_crops(rgb, [face])[0])
+    return names, crops
+
+
+def perturb(crop):
+    """Mirrored, slightly brightened copy of a crop, used as a query."""
+    return np.clip(crop[:, ::-1].astype(np.int16) + 12, 0, 255).astype(np.uint8)
+
+
+def embed(embedder, crops, batch_size, repeats):
+    """Embed crops in batches; returns (embeddings, ms per face)."""
+    tensors = [embedder.preprocess(Image.fromarray(np.ascontiguousarray(c))) for c in crops]
+    embedder.forward(tensors[:1])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = np.vstack([embedder.forward(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)])
+    elapsed = (time.perf_counter() - start) / repeats
+    return out, elapsed / len(tensors) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default='student_images')
+    parser.add_argument('--backends', nargs='+', default=['torch', 'torchscript', 'onnx', 'onnx-int8'])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--cache-dir', default='model_cache')
+    parser.add_argument('--backbone', default='resnet50')
+    args = parser.parse_args()
+
+    from app import app, db
+    from embedders import create_embedder
+    from face_recognizer import get_face_recognizer
+
+    with app.app_context():
+        names, crops = load_face_crops(args.images, get_face_recognizer(db))
+    if not crops:
+        print(f"No faces found in {args.images}")
+        return
+    queries = [perturb(c) for c in crops]
+    ids = np.arange(len(crops))
+    print(f"{len(crops)} faces from {args.images}")
+
+    reference = None
+    for spec in args.backends:
+        backend, _, variant = spec.partition('-')
+        try:
+            embedder = create_embedder(backend, quantize=variant == 'int8', cache_dir=args.cache_dir,
+                                       backbone=args.backbone)
+        except ImportError as e:
+            print(f"{spec:12s} skipped: {e}")
+            continue
+        gallery_vectors, ms_per_face = embed(embedder, crops, args.batch_size, args.repeats)
+        query_vectors, _ = embed(embedder, queries, args.batch_size, 1)
+        matches = [m['top_k'][0]['student_id']
+                   for m in Gallery(ids, names, gallery_vectors).match(query_vectors, threshold=2.0, top_k=1)]
+
+        line = f"{spec:12s} {ms_per_face:8.2f} ms/face  self-match {np.mean(np.array(matches) == ids):.3f}"
+        if reference is None:
+            reference = (gallery_vectors, matches)
+        else:
+            ref_vectors, ref_matches = reference
+            a = gallery_vectors / np.linalg.norm(gallery_vectors, axis=1, keepdims=True)
+            b = ref_vectors / np.linalg.norm(ref_vectors, axis=1, keepdims=True)
+            cosine = np.sum(a * b, axis=1)
+            identical = sum(m == r for m, r in zip(matches, ref_matches))
+            line += (f"  min cosine vs {args.backends[0]} {cosine.min():.5f}"
+                     f"  identical matches {identical}/{len(matches)}")
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Excel attendance export time against the length of the date range.
+
+Builds synthetic attendance for a roster (each student present on most
+days) and times the pivot and the write-only workbook separately for
+several range lengths. Needs no database. Run from the project root:
+
+    python benchmarks/excel_export.py --students 3000 --days 7 30 120
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, time as dtime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attendance_export import attendance_matrix, write_attendance_workbook  # noqa: E402
+
+
+def synthetic_rows(student_ids, start, days, attendance_rate, rng):
+    """(student id, date, time in) rows for the students present on each day."""
+    rows = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        present = rng.random(len(student_ids)) < attendance_rate
+        minutes = rng.integers(0, 120, size=len(student_ids))
+        rows.extend((student_id, day, dtime(8 + int(m) // 60, int(m) % 60))
+                    for student_id, is_present, m in zip(student_ids, present, minutes) if is_present)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=3000)
+    parser.add_argument('--days', type=int, nargs='+', default=[7, 30, 120])
+    parser.add_argument('--attendance-rate', type=float, default=0.9)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    student_ids = [f'S{i:05d}' for i in range(args.students)]
+    start = date(2024, 1, 1)
+    print(f"{args.students} students")
+    for days in args.days:
+        rows = synthetic_rows(student_ids, start, days, args.attendance_rate, rng)
+        end = start + timedelta(days=days - 1)
+
+        t0 = time.perf_counter()
+        matrix = attendance_matrix(rows, student_ids, start, end)
+        t1 = time.perf_counter()
+        output = write_attendance_workbook(matrix)
+        t2 = time.perf_counter()
+
+        print(f"{days:5d} days  {len(rows):9d} records  pivot {(t1 - t0) * 1000:8.1f} ms  "
+              f"workbook {(t2 - t1) * 1000:9.1f} ms  {len(output.getvalue()) / 1e6:6.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
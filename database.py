@@ -72,9 +72,9 @@ class Database:
             return False
 
         # Encode the face
-        from face_recognizer import FaceRecognizer
-        face_rec = FaceRecognizer(self)
-        encoding = face_rec.encode_face(image_frame)
+        from face_recognizer import get_face_recognizer
+        face_rec = get_face_recognizer(self)
+        encoding = face_rec.get_face_encoding(image_frame)
 
         if encoding is None:
             return False
@@ -119,9 +119,9 @@ class Database:
             student['image_path'] = image_path
 
             # Update face encoding
-            from face_recognizer import FaceRecognizer
-            face_rec = FaceRecognizer(self)
-            encoding = face_rec.encode_face(image_frame)
+            from face_recognizer import get_face_recognizer
+            face_rec = get_face_recognizer(self)
+            encoding = face_rec.get_face_encoding(image_frame)
 
             if encoding is not None:
                 student['encoding'] = encoding
@@ -0,0 +1,122 @@
+"""
+Process-pool face detection backend.
+
+dlib's HOG detector holds the GIL, so a single web worker can only use one
+core for detection. This backend copies the frame once into shared memory
+and has worker processes detect faces in overlapping horizontal bands of it;
+only the shared-memory name, the band coordinates and the resulting box
+arrays cross the process boundary.
+
+A face is only found whole if it lies inside one band, so neighbouring
+bands overlap by the tallest face expected. When that is a large part of
+the frame (portraits, enrollment photos) there are fewer bands, down to
+one band holding the whole frame.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Detector of each worker process, created by _init_worker
+_worker_detector = None
+
+
+def _init_worker():
+    global _worker_detector
+    import dlib
+    _worker_detector = dlib.get_frontal_face_detector()
+
+
+def _detect_band(shm_name, shape, dtype, y0, y1, upsample):
+    """Detect faces in rows y0:y1 of the shared frame; returns (N x 5) [x1, y1, x2, y2, score]."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        band = np.ascontiguousarray(np.ndarray(shape, dtype=dtype, buffer=shm.buf)[y0:y1])
+    finally:
+        shm.close()
+    detections, scores, _ = _worker_detector.run(band, upsample, 0)
+    boxes = np.array([[d.left(), d.top() + y0, d.right(), d.bottom() + y0, score]
+                      for d, score in zip(detections, scores)], dtype=np.float32)
+    return boxes.reshape(-1, 5)
+
+
+def non_max_suppression(boxes, iou_threshold=0.3):
+    """Merge duplicate detections from overlapping bands, keeping the highest score."""
+    if not len(boxes):
+        return boxes
+    order = np.argsort(-boxes[:, 4])
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        x1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        area_i = (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1])
+        area_rest = (boxes[rest, 2] - boxes[rest, 0]) * (boxes[rest, 3] - boxes[rest, 1])
+        iou = inter / np.maximum(area_i + area_rest - inter, 1e-9)
+        # Also drop boxes mostly contained in the kept one (a face cut by a band edge)
+        contained = inter / np.maximum(area_rest, 1e-9)
+        order = rest[(iou <= iou_threshold) & (contained <= 0.7)]
+    return boxes[keep]
+
+
+class ProcessDetector:
+    """Detect faces with a pool of worker processes working on bands of one frame."""
+
+    def __init__(self, processes=0, max_face_fraction=0.5, min_overlap=160, min_band_height=240):
+        """``max_face_fraction`` is the tallest face expected, as a fraction of the frame height.
+
+        Neighbouring bands share that many rows (at least ``min_overlap``),
+        so every face up to that size lies wholly inside some band.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.max_face_fraction = max_face_fraction
+        self.min_overlap = min_overlap
+        self.min_band_height = min_band_height
+        # spawn: the web process runs threads (and torch), which fork does not handle safely
+        self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker)
+
+    def overlap(self, height, max_face_fraction=None):
+        """Rows shared by neighbouring bands of a frame: the tallest expected face."""
+        fraction = self.max_face_fraction if max_face_fraction is None else max_face_fraction
+        return max(self.min_overlap, int(np.ceil(fraction * height)))
+
+    def bands(self, height, max_face_fraction=None):
+        """Row ranges covering the frame, at most one per process.
+
+        Consecutive bands overlap by ``overlap`` rows, so any run of that
+        many rows lies inside one band. Bands are kept at least as tall as
+        the overlap; otherwise most of each band would be detected twice.
+        """
+        overlap = self.overlap(height, max_face_fraction)
+        if overlap >= height:
+            return [(0, height)]
+        count = max(1, min(self.processes, height // max(self.min_band_height, overlap)))
+        step = int(np.ceil(height / count))
+        return [(max(0, start - overlap // 2), min(height, start + step + (overlap + 1) // 2))
+                for start in range(0, height, step)]
+
+    def detect(self, image, upsample=0, max_face_fraction=None):
+        """Return an (N x 4) int array of x1, y1, x2, y2 face boxes in image coordinates."""
+        image = np.ascontiguousarray(image)
+        shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        try:
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+            futures = [self._executor.submit(_detect_band, shm.name, image.shape, image.dtype.str, y0, y1, upsample)
+                       for y0, y1 in self.bands(image.shape[0], max_face_fraction)]
+            boxes = np.vstack([future.result() for future in futures])
+        finally:
+            shm.close()
+            shm.unlink()
+        return non_max_suppression(boxes)[:, :4].astype(np.int32)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,241 @@
+"""
+Face embedding backends.
+
+Every backend embeds preprocessed 224x224 face tensors with the pooled
+features of an ImageNet backbone (ResNet-50 by default, or a lighter
+ResNet-18/MobileNetV3), optionally followed by a PCA projection to fewer
+dimensions. The backends differ in how the network is executed:
+
+- ``torch``: eager PyTorch
+- ``torchscript``: traced and frozen TorchScript graph
+- ``onnx``: ONNX Runtime, optionally with dynamic int8 quantization
+
+ONNX Runtime is optional and only imported when that backend is selected.
+"""
+import hashlib
+import os
+import uuid
+
+import numpy as np
+import torch
+from torchvision import models, transforms
+
+# Backbones and the size of their pooled feature vector
+BACKBONES = {
+    'resnet50': 2048,
+    'resnet18': 512,
+    'mobilenet_v3_large': 960,
+    'mobilenet_v3_small': 576,
+}
+
+INPUT_SIZE = 224
+
+
+def backbone_version(backbone):
+    """Version of a backbone's embeddings; backends with identical numerics share it."""
+    return f'{backbone}-imagenet-avgpool-v1'
+
+
+def write_cache_file(path, write):
+    """Create a cache file by calling ``write(temporary_path)`` and moving the result into place.
+
+    Several server workers may warm up on a cold cache at once; readers
+    only ever see a missing or a complete file.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    partial = f'{path}.{uuid.uuid4().hex[:8]}.partial'
+    try:
+        write(partial)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def build_feature_extractor(backbone, device):
+    """Pretrained backbone with its classifier stripped off, in eval mode."""
+    if backbone not in BACKBONES:
+        raise ValueError(f"Unknown backbone: {backbone}")
+    network = getattr(models, backbone)(pretrained=True)
+    if backbone.startswith('resnet'):
+        # strip off the final classifier layer
+        feature_extractor = torch.nn.Sequential(*list(network.children())[:-1])
+    else:
+        feature_extractor = torch.nn.Sequential(network.features, network.avgpool)
+    feature_extractor = feature_extractor.to(device)
+    feature_extractor.eval()
+    return feature_extractor
+
+
+class TorchEmbedder:
+    """Eager-mode PyTorch embedder."""
+
+    name = 'torch'
+
+    def __init__(self, backbone='resnet50', cache_dir=None):
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.backbone = backbone
+        self.version = backbone_version(backbone)
+        self.dimension = BACKBONES[backbone]
+        self.transform = transforms.Compose([
+            transforms.Resize((INPUT_SIZE, INPUT_SIZE)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406],
+                                 std=[0.229, 0.224, 0.225])
+        ])
+        self.model = self._load_model(cache_dir)
+
+    def _load_model(self, cache_dir):
+        return build_feature_extractor(self.backbone, self.device)
+
+    def preprocess(self, pil_image):
+        """Turn a PIL face crop into a (3 x 224 x 224) tensor."""
+        return self.transform(pil_image)
+
+    def forward(self, tensors):
+        """Embed one batch of preprocessed tensors; returns an (N x D) float32 array."""
+        with torch.no_grad():
+            batch = torch.stack(tensors).to(self.device)
+            return self.model(batch).flatten(1).cpu().numpy().astype(np.float32)
+
+
+class TorchScriptEmbedder(TorchEmbedder):
+    """Traced, frozen TorchScript graph of the same network, cached on disk."""
+
+    name = 'torchscript'
+
+    def _load_model(self, cache_dir):
+        path = os.path.join(cache_dir, f'{self.version}.torchscript.pt') if cache_dir else None
+        if path and os.path.exists(path):
+            return torch.jit.load(path, map_location=self.device)
+
+        example = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE, device=self.device)
+        with torch.no_grad():
+            scripted = torch.jit.freeze(torch.jit.trace(build_feature_extractor(self.backbone, self.device), example))
+        if path:
+            write_cache_file(path, lambda partial: torch.jit.save(scripted, partial))
+        return scripted
+
+
+class OnnxEmbedder(TorchEmbedder):
+    """ONNX Runtime execution of the exported network, optionally int8-quantized."""
+
+    name = 'onnx'
+
+    def __init__(self, backbone='resnet50', cache_dir='model_cache', quantize=False):
+        self.quantize = quantize
+        super().__init__(backbone, cache_dir or 'model_cache')
+        if quantize:
+            # Quantized weights change the embeddings, so the gallery is versioned apart
+            self.version += '-int8'
+
+    def _load_model(self, cache_dir):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx embedder backend requires the onnxruntime package") from e
+
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f'{backbone_version(self.backbone)}.onnx')
+        if not os.path.exists(path):
+            example = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)
+            network = build_feature_extractor(self.backbone, torch.device('cpu'))
+            write_cache_file(path, lambda partial: torch.onnx.export(
+                network, example, partial,
+                input_names=['input'], output_names=['embedding'],
+                dynamic_axes={'input': {0: 'batch'}, 'embedding': {0: 'batch'}},
+                opset_version=17))
+        if self.quantize:
+            quantized_path = os.path.join(cache_dir, f'{backbone_version(self.backbone)}.int8.onnx')
+            if not os.path.exists(quantized_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                write_cache_file(quantized_path, lambda partial: quantize_dynamic(
+                    path, partial, weight_type=QuantType.QUInt8))
+            path = quantized_path
+
+        return onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+
+    def forward(self, tensors):
+        batch = torch.stack(tensors).numpy()
+        (embedding,) = self.model.run(None, {'input': batch})
+        return embedding.reshape(len(tensors), -1).astype(np.float32)
+
+
+class ProjectedEmbedder:
+    """Wraps an embedder with a PCA projection to a lower dimension.
+
+    The projection is fitted on L2-normalized backbone features. It is part
+    of the embedding version (including a hash of the fitted components), so
+    refitting it or changing its size leads to a re-embedding of the gallery
+    instead of comparing incompatible vectors.
+    """
+
+    def __init__(self, base, mean, components):
+        self.base = base
+        self.name = base.name
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+        self.dimension = len(components)
+        digest = hashlib.sha1(self.components.tobytes()).hexdigest()[:8]
+        self.version = f'{base.version}-pca{self.dimension}-{digest}'
+
+    def preprocess(self, pil_image):
+        return self.base.preprocess(pil_image)
+
+    def forward(self, tensors):
+        features = self.base.forward(tensors)
+        features /= np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+        return (features - self.mean) @ self.components.T
+
+
+def projection_path(cache_dir, base_version, dimension):
+    """File holding the PCA projection of a base embedding version."""
+    return os.path.join(cache_dir, f'{base_version}.pca{dimension}.npz')
+
+
+def fit_pca(vectors, dimension):
+    """Fit a PCA projection; returns (mean, components) with at most N - 1 components."""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    dimension = min(dimension, len(vectors) - 1, vectors.shape[1])
+    if dimension < 1:
+        raise ValueError("At least two embeddings are needed to fit a projection")
+    mean = vectors.mean(axis=0)
+    _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+    return mean, vt[:dimension]
+
+
+def save_projection(path, mean, components):
+    def write(partial):
+        # Through a file object, so np.savez keeps the name as given
+        with open(partial, 'wb') as f:
+            np.savez(f, mean=mean, components=components)
+    write_cache_file(path, write)
+
+
+EMBEDDER_BACKENDS = {
+    'torch': TorchEmbedder,
+    'torchscript': TorchScriptEmbedder,
+    'onnx': OnnxEmbedder,
+}
+
+
+def create_embedder(backend='torch', quantize=False, cache_dir='model_cache', backbone='resnet50', dimension=0):
+    """Build the embedder for a backend name, backbone and optional projected dimension."""
+    if backend not in EMBEDDER_BACKENDS:
+        raise ValueError(f"Unknown embedder backend: {backend}")
+    if backend == 'onnx':
+        embedder = OnnxEmbedder(backbone, cache_dir, quantize=quantize)
+    else:
+        if quantize:
+            print(f"Int8 quantization is only available with the onnx backend; using {backend} in float32")
+        embedder = EMBEDDER_BACKENDS[backend](backbone, cache_dir)
+
+    if dimension and dimension < embedder.dimension:
+        path = projection_path(cache_dir, embedder.version, dimension)
+        if not os.path.exists(path):
+            print(f"No projection fitted at {path}; using {embedder.dimension}-d embeddings. "
+                  f"Run 'flask fit-projection --dimension {dimension}' to create it.")
+            return embedder
+        data = np.load(path)
+        embedder = ProjectedEmbedder(embedder, data['mean'], data['components'])
+    return embedder
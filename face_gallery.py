@@ -0,0 +1,158 @@
+"""
+In-memory gallery of student face embeddings for vectorized matching.
+"""
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row of a 2-D float array."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class Gallery:
+    """Student embeddings held as one contiguous (N x D) float32 matrix.
+
+    Rows are L2-normalized, so the Euclidean distance between a face and a
+    student is sqrt(2 - 2 * cosine similarity) and every face in a frame can
+    be scored against every student with a single matrix multiply.
+    """
+
+    def __init__(self, student_ids, names, vectors):
+        """Build the gallery from parallel sequences of ids, names and embeddings."""
+        self.student_ids = np.asarray(student_ids, dtype=np.int64)
+        self.names = list(names)
+        self._rows = {int(student_id): i for i, student_id in enumerate(self.student_ids)}
+        if len(vectors):
+            self.matrix = normalize_rows(np.vstack(vectors))
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a gallery from (student id, name, vector) rows.
+
+        Vectors whose dimension differs from the most common one (e.g. an
+        image enrolled through the dlib fallback) cannot be compared and are
+        left out.
+        """
+        dims = [len(vector) for _, _, vector in rows]
+        if not dims:
+            return cls([], [], [])
+        dim = max(set(dims), key=dims.count)
+        kept = [row for row in rows if len(row[2]) == dim]
+        if len(kept) != len(rows):
+            print(f"Skipping {len(rows) - len(kept)} gallery embedding(s) with dimension != {dim}")
+        return cls([r[0] for r in kept], [r[1] for r in kept], [r[2] for r in kept])
+
+    def updated(self, rows, removed_ids=()):
+        """Return a new gallery with (student id, name, vector) rows inserted or replaced
+        and ``removed_ids`` dropped; this gallery is left untouched for concurrent readers.
+
+        Rows whose dimension differs from the gallery's are left out.
+        """
+        if not len(self):
+            return Gallery.from_rows(rows)
+        student_ids = self.student_ids.tolist()
+        names = list(self.names)
+        matrix = self.matrix.copy()
+        appended_ids, appended_names, appended_vectors = [], [], []
+        skipped = 0
+        for student_id, name, vector in rows:
+            if len(vector) != self.dimension:
+                skipped += 1
+                continue
+            row = self._rows.get(int(student_id))
+            if row is None:
+                appended_ids.append(int(student_id))
+                appended_names.append(name)
+                appended_vectors.append(vector)
+            else:
+                names[row] = name
+                matrix[row] = normalize_rows(np.atleast_2d(vector))[0]
+        if skipped:
+            print(f"Skipping {skipped} gallery embedding(s) with dimension != {self.dimension}")
+
+        removed = {int(student_id) for student_id in removed_ids}
+        keep = [i for i, student_id in enumerate(student_ids) if student_id not in removed]
+        return Gallery([student_ids[i] for i in keep] + appended_ids,
+                       [names[i] for i in keep] + appended_names,
+                       np.vstack([matrix[keep], *appended_vectors]) if appended_vectors else matrix[keep])
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def __contains__(self, student_id):
+        return int(student_id) in self._rows
+
+    def vectors_of(self, student_ids):
+        """Normalized vectors of students in the gallery, as an (N x D) array."""
+        return self.matrix[[self._rows[int(student_id)] for student_id in student_ids]]
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1] if len(self) else 0
+
+    def name_of(self, student_id):
+        """Return the name stored for a student id, or None."""
+        row = self._rows.get(int(student_id))
+        return self.names[row] if row is not None else None
+
+    def search(self, encodings, top_k=5):
+        """Score all faces against all students.
+
+        Returns (indices, similarities), both (F x k) arrays sorted by
+        descending cosine similarity, where k = min(top_k, len(self)).
+        """
+        queries = normalize_rows(np.atleast_2d(encodings))
+        scores = queries @ self.matrix.T
+        k = min(top_k, scores.shape[1])
+        if k < scores.shape[1]:
+            idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        part = np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-part, axis=1)
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+    def match(self, encodings, threshold=0.4, top_k=5, index=None):
+        """Return the true nearest student for each face.
+
+        Each result is a dict with the best match (or None when its distance
+        is not under the threshold), the distance margin to the runner-up and
+        the top-k candidates. ``index`` may be an approximate index whose
+        ``search`` returns student ids (padded with -1) to replace the exact
+        scan.
+        """
+        encodings = np.atleast_2d(encodings)
+        if not len(self) or encodings.shape[1] != self.dimension:
+            return [{'student_id': None, 'name': None, 'distance': None, 'margin': None, 'top_k': []}
+                    for _ in range(len(encodings))]
+
+        if index is None:
+            indices, similarities = self.search(encodings, max(top_k, 2))
+        else:
+            ids, similarities = index.search(encodings, max(top_k, 2))
+            indices = np.vectorize(lambda sid: self._rows.get(int(sid), -1), otypes=[np.int64])(ids)
+        distances = np.sqrt(np.clip(2.0 - 2.0 * similarities, 0.0, None))
+
+        results = []
+        for face_idx in range(len(encodings)):
+            candidates = [{
+                'student_id': int(self.student_ids[i]),
+                'name': self.names[i],
+                'distance': float(d)
+            } for i, d in zip(indices[face_idx], distances[face_idx]) if i >= 0]
+            best = candidates[0] if candidates else None
+            margin = candidates[1]['distance'] - best['distance'] if len(candidates) > 1 else None
+            matched = best is not None and best['distance'] < threshold
+            results.append({
+                'student_id': best['student_id'] if matched else None,
+                'name': best['name'] if matched else None,
+                'distance': best['distance'] if best else None,
+                'margin': margin,
+                'top_k': candidates[:top_k]
+            })
+        return results
@@ -0,0 +1,112 @@
+"""
+Approximate nearest-neighbour index (IVF) for large face galleries.
+
+Vectors are assigned to the nearest of a set of k-means centroids
+("inverted lists"); a query only scans the lists of its ``n_probe``
+closest centroids instead of the whole gallery. Everything runs locally
+with NumPy.
+"""
+import numpy as np
+
+from face_gallery import normalize_rows
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=10, seed=0):
+    """Cluster L2-normalized vectors by cosine similarity and return the centroids."""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, min(n_clusters, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        empty = counts == 0
+        # Re-seed empty clusters with random vectors so no list is wasted
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over student ids with incremental insert and delete."""
+
+    def __init__(self, n_lists=None, n_probe=8, seed=0):
+        """Create an untrained index; ``n_lists`` defaults to about 4 * sqrt(N) at training time."""
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+        self._list_ids = []
+        self._list_vectors = []
+        self._location = {}  # student id -> list number
+
+    def __len__(self):
+        return len(self._location)
+
+    def train(self, student_ids, vectors):
+        """Learn the coarse quantizer from a gallery and (re)build all lists."""
+        vectors = normalize_rows(vectors)
+        n_lists = self.n_lists or int(4 * np.sqrt(len(vectors)))
+        self.centroids = spherical_kmeans(vectors, max(1, n_lists), seed=self.seed)
+        self.trained_size = len(vectors)
+        dim = vectors.shape[1]
+        self._list_ids = [np.zeros(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self._list_vectors = [np.zeros((0, dim), dtype=np.float32) for _ in range(len(self.centroids))]
+        self._location = {}
+        self.add(student_ids, vectors)
+
+    def add(self, student_ids, vectors):
+        """Insert (or replace) vectors for the given student ids."""
+        if not len(student_ids):
+            return
+        vectors = normalize_rows(vectors)
+        for student_id in student_ids:
+            if int(student_id) in self._location:
+                self.remove(student_id)
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        for list_no in np.unique(assignment):
+            rows = assignment == list_no
+            ids = np.asarray(student_ids, dtype=np.int64)[rows]
+            self._list_ids[list_no] = np.concatenate([self._list_ids[list_no], ids])
+            self._list_vectors[list_no] = np.vstack([self._list_vectors[list_no], vectors[rows]])
+            for student_id in ids:
+                self._location[int(student_id)] = int(list_no)
+
+    def remove(self, student_id):
+        """Delete a student's vector from the index if present."""
+        list_no = self._location.pop(int(student_id), None)
+        if list_no is None:
+            return
+        keep = self._list_ids[list_no] != int(student_id)
+        self._list_ids[list_no] = self._list_ids[list_no][keep]
+        self._list_vectors[list_no] = self._list_vectors[list_no][keep]
+
+    def search(self, queries, top_k=5):
+        """Return (student ids, similarities) as (F x top_k) arrays, padded with -1 / -inf."""
+        queries = normalize_rows(np.atleast_2d(queries))
+        ids_out = np.full((len(queries), top_k), -1, dtype=np.int64)
+        sims_out = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        if self.centroids is None or not len(self):
+            return ids_out, sims_out
+
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :n_probe]
+        for q, query in enumerate(queries):
+            lists = [l for l in probes[q] if len(self._list_ids[l])]
+            if not lists:
+                continue
+            ids = np.concatenate([self._list_ids[l] for l in lists])
+            scores = np.concatenate([self._list_vectors[l] @ query for l in lists])
+            k = min(top_k, len(ids))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            ids_out[q, :k] = ids[best]
+            sims_out[q, :k] = scores[best]
+        return ids_out, sims_out
+
+    def needs_retraining(self, size):
+        """True once the gallery has grown or shrunk enough that the centroids are stale."""
+        return self.centroids is None or size > 2 * self.trained_size or size < self.trained_size // 2
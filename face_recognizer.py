@@ -1,12 +1,24 @@
 """Face recognition implementation with dlib"""
 import os
+import threading
+import time
 import cv2
 import numpy as np
 import dlib
-from datetime import datetime
-from models import Student
-import torch
-from torchvision import models, transforms
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import func
+from app import db as sql_db
+from sqlalchemy.exc import IntegrityError
+from embedders import create_embedder, fit_pca, projection_path, save_projection
+from face_gallery import Gallery, normalize_rows
+from face_index import IVFIndex
+from detection_pool import ProcessDetector
+from inference_scheduler import BatchScheduler
+from recognition_session import SessionRegistry
+import metrics
+from models import Student, FaceEmbedding
+from utils import get_current_datetime
 from PIL import Image
 
 # Configure dlib's face detector
@@ -14,30 +26,171 @@ face_detector = dlib.get_frontal_face_detector()
 shape_predictor = dlib.shape_predictor('shape_predictor_68_face_landmarks.dat') if os.path.exists('shape_predictor_68_face_landmarks.dat') else None
 face_rec = dlib.face_recognition_model_v1('dlib_face_recognition_resnet_model_v1.dat') if os.path.exists('dlib_face_recognition_resnet_model_v1.dat') else None
 
+# Recognizer settings; overridden by matching keys in the Flask app config
+DEFAULT_SETTINGS = {
+    'FACE_EMBEDDER_BACKEND': 'torch',  # 'torch', 'torchscript' or 'onnx'
+    'FACE_EMBEDDER_QUANTIZE': False,  # Dynamic int8 quantization (onnx backend)
+    'FACE_MODEL_CACHE_DIR': 'model_cache',  # Exported/compiled models are kept here
+    'FACE_BACKBONE': 'resnet50',  # 'resnet50', 'resnet18', 'mobilenet_v3_large' or 'mobilenet_v3_small'
+    'FACE_EMBEDDING_DIM': 0,  # PCA-project embeddings to this many dimensions; 0 keeps the backbone's
+    'FACE_MATCH_THRESHOLD': 0.4,  # Max distance between L2-normalized embeddings
+    'FACE_MATCH_TOP_K': 5,
+    'FACE_INDEX': 'auto',  # 'exact', 'ivf', or 'auto' (IVF once the gallery is large)
+    'FACE_INDEX_MIN_SIZE': 5000,
+    'FACE_INDEX_NLISTS': 0,  # 0 picks about 4 * sqrt(gallery size)
+    'FACE_INDEX_NPROBE': 8,
+    'FACE_EMBED_BATCH_SIZE': 32,  # Max crops per forward pass
+    'FACE_BATCH_SCHEDULER': True,  # Share forward passes between concurrent requests
+    'FACE_BATCH_MAX_WAIT_MS': 5.0,
+    'FACE_ALIGN': True,  # Align crops with the 68-point landmarks when the predictor file exists
+    'FACE_DETECTION_SCALE': 1.0,  # Resize factor applied to frames before HOG detection
+    'FACE_DETECTION_UPSAMPLE': 0,  # dlib upsampling passes, for small faces in large rooms
+    'FACE_DETECTION_BACKEND': 'inline',  # 'inline', or 'process' to detect in a process pool
+    'FACE_DETECTION_PROCESSES': 0,  # Pool size for the process backend; 0 uses every core
+    'FACE_DETECTION_MAX_FACE': 0.5,  # Tallest face expected in a frame, as a fraction of its height
+    'FACE_TRACKING': True,  # Reuse identities of tracked faces within a recognition session
+    'FACE_TRACK_REVERIFY_FRAMES': 30,  # Re-embed confirmed tracks after this many frames
+    'FACE_FRAME_GATE': True,  # Reuse the previous result when a session's scene has not changed
+    'FACE_FRAME_GATE_THRESHOLD': 4.0,  # Mean grey-level difference that counts as a change
+    'FACE_FRAME_GATE_MAX_SKIPS': 10,
+}
+
+# Smallest face (in pixels) dlib's HOG detector finds without upsampling
+HOG_MIN_FACE_SIZE = 80
+
+# Gallery rows are re-read from this long before the newest change already
+# applied, so rows committed late by a concurrent enrollment are not missed
+GALLERY_SYNC_SLACK = timedelta(seconds=60)
+
+# Process-wide model registry. Building the network is far more expensive
+# than running it, so embedders and the shared recognizer are created once
+# per process and reused by every request, the desktop app and enrollment.
+_registry_lock = threading.RLock()
+_embedders = {}
+_shared_recognizer = None
+
+
+def get_embedder(backend='torch', quantize=False, cache_dir='model_cache', backbone='resnet50', dimension=0):
+    """Return the process-wide embedder for a backend and backbone, building it on first use."""
+    key = (backend, bool(quantize), cache_dir, backbone, int(dimension or 0))
+    if key not in _embedders:
+        with _registry_lock:
+            if key not in _embedders:
+                _embedders[key] = create_embedder(backend, quantize=quantize, cache_dir=cache_dir,
+                                                  backbone=backbone, dimension=int(dimension or 0))
+    return _embedders[key]
+
+
+def get_face_recognizer(database=None):
+    """Return the shared FaceRecognizer for this process, creating it on first use."""
+    global _shared_recognizer
+    if _shared_recognizer is None:
+        with _registry_lock:
+            if _shared_recognizer is None:
+                settings = current_app.config if has_app_context() else None
+                _shared_recognizer = FaceRecognizer(database, settings)
+    if database is not None and _shared_recognizer.db is None:
+        _shared_recognizer.db = database
+    return _shared_recognizer
+
+
+def warm_up(database=None):
+    """Load the model, run one dummy forward pass and start embedding students missing from the gallery."""
+    recognizer = get_face_recognizer(database)
+    dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+    recognizer.embedder.forward([recognizer.embedder.preprocess(Image.fromarray(dummy))])
+    try:
+        # Loading the gallery starts training the approximate index, if one is used
+        recognizer.get_gallery()
+    except Exception as e:
+        print(f"Error loading the face gallery: {e}")
+    try:
+        start_reembedding(recognizer)
+    except Exception as e:
+        print(f"Error backfilling gallery embeddings: {e}")
+    return recognizer
+
+
+def start_reembedding(recognizer):
+    """Backfill the gallery for the current model version on a background thread.
+
+    After switching backbone, backend or projection the gallery of the new
+    version starts empty; students are matched as soon as their embedding is
+    committed, while stale vectors of other versions are never compared.
+    Returns the thread, or None when nothing needs embedding.
+    """
+    pending = recognizer.pending_gallery_count()
+    metrics.set_gauge('gallery_embeddings_pending', pending)
+    if not pending:
+        return None
+    print(f"Embedding {pending} student image(s) for model {recognizer.model_version} in the background")
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                count = recognizer.backfill_gallery()
+                print(f"Embedded {count} student image(s) for model {recognizer.model_version}")
+            except Exception as e:
+                sql_db.session.rollback()
+                print(f"Error backfilling gallery embeddings: {e}")
+
+    thread = threading.Thread(target=run, name='gallery-reembedding', daemon=True)
+    thread.start()
+    return thread
+
+
 class FaceRecognizer:
-    def __init__(self, database):
+    def __init__(self, database=None, settings=None):
         """Initialize the face recognizer with a database connection."""
         self.db = database
+        self.settings = {key: (settings or {}).get(key, default) for key, default in DEFAULT_SETTINGS.items()}
         self.face_detector = face_detector
         self.shape_predictor = shape_predictor
         self.face_rec = face_rec
+        self.align = bool(self.settings['FACE_ALIGN']) and self.shape_predictor is not None
 
         # Ensure student_images directory exists
         if not os.path.exists('student_images'):
             os.makedirs('student_images')
 
-        # ——— New: load Torchvision ResNet-50 for face embeddings ———
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        _resnet = models.resnet50(pretrained=True).to(self.device)
-        _resnet.eval()
-        # strip off the final classifier layer
-        self.feature_extractor = torch.nn.Sequential(*list(_resnet.children())[:-1]).to(self.device)
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                 std=[0.229, 0.224, 0.225])
-        ])
+        # Face embedder for the configured backend and backbone, shared across instances
+        self.embedder = get_embedder(self.settings['FACE_EMBEDDER_BACKEND'],
+                                     self.settings['FACE_EMBEDDER_QUANTIZE'],
+                                     self.settings['FACE_MODEL_CACHE_DIR'],
+                                     self.settings['FACE_BACKBONE'],
+                                     self.settings['FACE_EMBEDDING_DIM'])
+        # Gallery vectors are keyed by this; vectors of another version are ignored and
+        # recomputed. Aligned and unaligned crops give different embeddings.
+        self.model_version = self.embedder.version + ('-aligned' if self.align else '')
+
+        # In-memory copy of the gallery and the database state it was loaded from
+        self._gallery = Gallery([], [], [])
+        self._gallery_signature = None
+        self._gallery_synced_at = None  # Newest updated_at applied to the gallery
+        self._gallery_lock = threading.Lock()
+        self._index = None
+        # Student ids changed while a new index trains in the background, or None
+        self._index_changes = None
+
+        # Tracker and change-gate state of active recognition sessions
+        self.sessions = SessionRegistry(
+            tracking=self.settings['FACE_TRACKING'],
+            gating=self.settings['FACE_FRAME_GATE'],
+            tracker_options={'reverify_every': self.settings['FACE_TRACK_REVERIFY_FRAMES']},
+            gate_options={'threshold': self.settings['FACE_FRAME_GATE_THRESHOLD'],
+                          'max_skips': self.settings['FACE_FRAME_GATE_MAX_SKIPS']}
+        )
+
+        # Process-pool detection backend, started on first use
+        self._process_detector = None
+
+        # Cross-request micro-batching of forward passes
+        self.scheduler = None
+        if self.settings['FACE_BATCH_SCHEDULER']:
+            self.scheduler = BatchScheduler(self._forward,
+                                            max_batch_size=self.settings['FACE_EMBED_BATCH_SIZE'],
+                                            max_wait_ms=self.settings['FACE_BATCH_MAX_WAIT_MS'])
 
     def load_student_image(self, image_path):
         """Load and preprocess a student's image"""
@@ -45,86 +198,430 @@ class FaceRecognizer:
             return None
         return cv2.imread(image_path)
 
-    def get_face_encoding(self, image):
-        """Get face encoding from image"""
-        # ——— Try Torch-based embedding first ———
+    def detect_faces(self, rgb_image, scale=None, upsample=None, backend=None):
+        """Detect faces in an RGB image and return dlib rectangles in its coordinates.
+
+        Detection runs on a copy resized by ``scale`` (FACE_DETECTION_SCALE by
+        default) with ``upsample`` dlib upsampling passes; the boxes are mapped
+        back to full resolution for cropping. ``backend`` overrides
+        FACE_DETECTION_BACKEND, e.g. 'inline' for single portrait photos.
+        """
+        scale = float(self.settings['FACE_DETECTION_SCALE'] if scale is None else scale)
+        upsample = int(self.settings['FACE_DETECTION_UPSAMPLE'] if upsample is None else upsample)
+
+        small = rgb_image
+        if scale > 0 and scale != 1.0:
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+            small = cv2.resize(rgb_image, None, fx=scale, fy=scale, interpolation=interpolation)
+        else:
+            scale = 1.0
+
+        backend = backend or self.settings['FACE_DETECTION_BACKEND']
+        start = time.perf_counter()
+        if backend == 'process':
+            detections = [dlib.rectangle(*map(int, box))
+                          for box in self.get_process_detector().detect(small, upsample)]
+        else:
+            detections = self.face_detector(small, upsample)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        height, width = small.shape[:2]
+        metrics.observe(f'detection_ms@{width}x{height}/up{upsample}/{backend}', elapsed_ms)
+
+        # Map boxes back to full resolution and clamp them to the image
+        full_height, full_width = rgb_image.shape[:2]
+        faces = []
+        for d in detections:
+            x1 = max(int(round(d.left() / scale)), 0)
+            y1 = max(int(round(d.top() / scale)), 0)
+            x2 = min(int(round(d.right() / scale)), full_width)
+            y2 = min(int(round(d.bottom() / scale)), full_height)
+            if x2 > x1 and y2 > y1:
+                faces.append(dlib.rectangle(x1, y1, x2, y2))
+        return faces
+
+    def get_process_detector(self):
+        """Return the process-pool detector, starting its worker processes on first use"""
+        if self._process_detector is None:
+            with _registry_lock:
+                if self._process_detector is None:
+                    self._process_detector = ProcessDetector(self.settings['FACE_DETECTION_PROCESSES'],
+                                                             self.settings['FACE_DETECTION_MAX_FACE'])
+        return self._process_detector
+
+    def min_face_size(self, scale=None, upsample=None):
+        """Approximate smallest detectable face, in full-resolution pixels, for a detection setting"""
+        scale = float(self.settings['FACE_DETECTION_SCALE'] if scale is None else scale) or 1.0
+        upsample = int(self.settings['FACE_DETECTION_UPSAMPLE'] if upsample is None else upsample)
+        return HOG_MIN_FACE_SIZE / (scale * 2 ** upsample)
+
+    def get_face_crops(self, rgb_image, faces, shapes=None):
+        """Cut already-detected faces out of an RGB image.
+
+        With landmarks (passed in, or computed when alignment is enabled) the
+        faces are rotated and scaled into aligned chips; otherwise the boxes
+        are cropped as-is.
+        """
+        if shapes is None and self.align:
+            shapes = [self.shape_predictor(rgb_image, face) for face in faces]
+        if shapes is not None:
+            return [dlib.get_face_chip(rgb_image, shape, size=224, padding=0.25) for shape in shapes]
+
+        return [rgb_image[face.top():face.bottom(), face.left():face.right()] for face in faces]
+
+    def get_face_encoding(self, image, face=None, shape=None):
+        """Get face encoding from a BGR image.
+
+        If no face box is given the largest detected face is used; the image
+        is only run through the detector in that case.
+        """
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        faces = self.face_detector(rgb_image)
-        if faces:
-            # crop out the first face
-            f = faces[0]
-            x1, y1, x2, y2 = f.left(), f.top(), f.right(), f.bottom()
-            face_img = rgb_image[y1:y2, x1:x2]
-            pil_img = Image.fromarray(face_img)
-            tensor = self.transform(pil_img).unsqueeze(0).to(self.device)
-            with torch.no_grad():
-                feat = self.feature_extractor(tensor)
-            return feat.squeeze().cpu().numpy()
-
-        # ——— Fallback to your existing dlib pipeline ———
+        if face is None:
+            faces = self.detect_faces(rgb_image)
+            if not faces:
+                return None
+            face = max(faces, key=lambda f: f.area())
+
+        # ——— Try Torch-based embedding first ———
+        try:
+            crops = self.get_face_crops(rgb_image, [face], [shape] if shape is not None else None)
+            if crops:
+                return self.get_face_encodings(crops)[0]
+        except Exception as e:
+            print(f"Error computing torch face embedding: {e}")
+
+        # ——— Fallback to the dlib pipeline, reusing the same box ———
         if self.shape_predictor and self.face_rec:
-            faces = self.face_detector(rgb_image)
-            if len(faces) > 0:
-                shape = self.shape_predictor(rgb_image, faces[0])
-                return np.array(self.face_rec.compute_face_descriptor(rgb_image, shape))
+            if shape is None:
+                shape = self.shape_predictor(rgb_image, face)
+            return np.array(self.face_rec.compute_face_descriptor(rgb_image, shape), dtype=np.float32)
         return None
 
-    def recognize_faces(self, frame):
-        """Detect and recognize faces in the frame"""
+    def compute_student_embedding(self, image_path):
+        """Compute the gallery embedding for a stored student image."""
+        student_img = self.load_student_image(image_path)
+        if student_img is None:
+            return None
+        # A portrait's face can fill the photo, which the banded process backend would split
+        faces = self.detect_faces(cv2.cvtColor(student_img, cv2.COLOR_BGR2RGB), backend='inline')
+        if not faces:
+            return None
+        encoding = self.get_face_encoding(student_img, face=max(faces, key=lambda f: f.area()))
+        if encoding is None:
+            return None
+        return np.asarray(encoding, dtype=np.float32)
+
+    def enroll_student(self, student):
+        """Store the gallery embedding for a student, recomputing it only if the image changed.
+
+        The caller is responsible for committing the session.
+        """
+        embedding = FaceEmbedding.query.filter_by(student_id=student.id, model_version=self.model_version).first()
+        if not student.image_path:
+            if embedding:
+                sql_db.session.delete(embedding)
+            return None
+
+        if embedding and embedding.image_path == student.image_path:
+            # Image unchanged: keep the vector, but bump the timestamp so
+            # cached galleries pick up edits such as a new name.
+            embedding.updated_at = get_current_datetime()
+            return embedding
+
+        encoding = self.compute_student_embedding(os.path.join('student_images', student.image_path))
+        if encoding is None:
+            print(f"No face found in image for student {student.id}")
+            if embedding:
+                sql_db.session.delete(embedding)
+            return None
+
+        if embedding is None:
+            embedding = FaceEmbedding(student_id=student.id, model_version=self.model_version)
+            sql_db.session.add(embedding)
+        embedding.image_path = student.image_path
+        embedding.vector = encoding.tobytes()
+        embedding.updated_at = get_current_datetime()
+        return embedding
+
+    def _students_to_embed(self):
+        """Students whose image has no up-to-date embedding for the current model."""
+        current = dict(sql_db.session.query(FaceEmbedding.student_id, FaceEmbedding.image_path)
+                       .filter(FaceEmbedding.model_version == self.model_version).all())
+        return [student for student in Student.query.filter(Student.image_path.isnot(None)).all()
+                if current.get(student.id) != student.image_path]
+
+    def pending_gallery_count(self):
+        return len(self._students_to_embed())
+
+    def backfill_gallery(self, commit_every=32):
+        """Embed every student whose image has no up-to-date embedding for the current model.
+
+        Commits every ``commit_every`` students so a long re-embedding fills
+        the gallery progressively. A batch that collides with another process
+        embedding the same students is rolled back and skipped.
+        """
+        students = self._students_to_embed()
+        count = 0
+        for start in range(0, len(students), commit_every):
+            batch = students[start:start + commit_every]
+            embedded = sum(self.enroll_student(student) is not None for student in batch)
+            try:
+                sql_db.session.commit()
+                count += embedded
+            except IntegrityError:
+                sql_db.session.rollback()
+            metrics.set_gauge('gallery_embeddings_pending', max(0, len(students) - start - len(batch)))
+        return count
+
+    def prune_gallery(self):
+        """Delete the gallery embeddings of every other model version; the caller commits."""
+        return FaceEmbedding.query.filter(FaceEmbedding.model_version != self.model_version) \
+            .delete(synchronize_session=False)
+
+    def fit_projection(self, dimension):
+        """Fit the PCA projection for FACE_EMBEDDING_DIM on the unprojected gallery.
+
+        Returns (path, dimension); the dimension is capped by the number of
+        gallery embeddings. The new projection takes effect after a restart,
+        which then re-embeds the gallery under the projected model version.
+        """
+        base = getattr(self.embedder, 'base', self.embedder)
+        base_version = base.version + ('-aligned' if self.align else '')
+        vectors = [np.frombuffer(vector, dtype=np.float32) for (vector,) in
+                   sql_db.session.query(FaceEmbedding.vector).filter(FaceEmbedding.model_version == base_version)]
+        if not vectors:
+            raise ValueError(f"No {base_version} embeddings to fit on; "
+                             f"run 'flask embed-gallery' with FACE_EMBEDDING_DIM=0 first")
+        mean, components = fit_pca(normalize_rows(np.vstack(vectors)), dimension)
+        path = projection_path(self.settings['FACE_MODEL_CACHE_DIR'], base.version, dimension)
+        save_projection(path, mean, components)
+        return path, len(components)
+
+    def _current_gallery_signature(self):
+        """Cheap aggregate that changes whenever a gallery row is added, removed or updated."""
+        return tuple(sql_db.session.query(
+            func.count(FaceEmbedding.id),
+            func.sum(FaceEmbedding.id),
+            func.max(FaceEmbedding.updated_at)
+        ).filter(FaceEmbedding.model_version == self.model_version).one())
+
+    def get_gallery(self):
+        """Return the cached Gallery, applying the embedding rows changed since it was loaded."""
+        signature = self._current_gallery_signature()
+        if signature != self._gallery_signature:
+            with self._gallery_lock:
+                if signature != self._gallery_signature:
+                    self._apply_gallery_changes(signature)
+        return self._gallery
+
+    def _gallery_rows(self, *criteria):
+        """(student id, name, vector, updated_at) of the current version's embeddings matching ``criteria``."""
+        rows = sql_db.session.query(FaceEmbedding.student_id, Student.name, FaceEmbedding.vector,
+                                    FaceEmbedding.updated_at) \
+            .join(Student, Student.id == FaceEmbedding.student_id) \
+            .filter(FaceEmbedding.model_version == self.model_version, *criteria).all()
+        return [(student_id, name, np.frombuffer(vector, dtype=np.float32), updated_at)
+                for student_id, name, vector, updated_at in rows]
+
+    def _apply_gallery_changes(self, signature):
+        """Bring the gallery and index up to date with per-student deltas (holding _gallery_lock).
+
+        Only rows updated since the last sync are read (enrollment and name
+        edits bump updated_at). Ids are compared only when the row count
+        shows that rows were deleted or missed.
+        """
+        criteria = []
+        if self._gallery_synced_at is not None:
+            criteria.append(FaceEmbedding.updated_at >= self._gallery_synced_at - GALLERY_SYNC_SLACK)
+        rows = self._gallery_rows(*criteria)
+        removed = []
+        gallery = self._gallery.updated([row[:3] for row in rows])
+        if len(gallery) != signature[0]:
+            current = {student_id for (student_id,) in sql_db.session.query(FaceEmbedding.student_id)
+                       .filter(FaceEmbedding.model_version == self.model_version)}
+            known = {int(student_id) for student_id in gallery.student_ids}
+            removed = list(known - current)
+            missed = current - known
+            if missed:
+                rows += self._gallery_rows(FaceEmbedding.student_id.in_(missed))
+            gallery = self._gallery.updated([row[:3] for row in rows], removed)
+
+        timestamps = [updated_at for *_, updated_at in rows if updated_at is not None]
+        if timestamps:
+            self._gallery_synced_at = max(timestamps)
+        changed = list({int(row[0]) for row in rows if row[0] in gallery})
+        self._update_index(gallery, changed, removed)
+        self._gallery = gallery
+        self._gallery_signature = signature
+
+    def _use_index(self, size):
+        """Decide between exact search and the approximate index for a gallery size."""
+        mode = self.settings['FACE_INDEX']
+        if mode == 'ivf':
+            return size > 0
+        if mode == 'auto':
+            return size >= self.settings['FACE_INDEX_MIN_SIZE']
+        return False
+
+    def _update_index(self, gallery, changed_ids, removed_ids):
+        """Apply gallery deltas to the approximate index, (re)training it in the background when needed.
+
+        Until a first index is trained, matching uses the exact search; while
+        a retrained one is built the current index keeps serving.
+        """
+        if not self._use_index(len(gallery)):
+            self._index = None
+            return
+        if self._index is not None:
+            for student_id in removed_ids:
+                self._index.remove(student_id)
+            if changed_ids:
+                self._index.add(changed_ids, gallery.vectors_of(changed_ids))
+        if self._index_changes is not None:
+            # Replayed onto the new index once its training finishes
+            self._index_changes.update(changed_ids)
+            self._index_changes.update(removed_ids)
+        elif self._index is None or self._index.needs_retraining(len(gallery)):
+            self._start_index_training(gallery)
+
+    def _start_index_training(self, gallery):
+        """Train a new IVF index on a gallery snapshot on a background thread (holding _gallery_lock)."""
+        self._index_changes = set()
+
+        def train():
+            index = IVFIndex(n_lists=self.settings['FACE_INDEX_NLISTS'] or None,
+                             n_probe=self.settings['FACE_INDEX_NPROBE'])
+            start = time.perf_counter()
+            try:
+                index.train(gallery.student_ids, gallery.matrix)
+            except Exception as e:
+                print(f"Error training the face index: {e}")
+                with self._gallery_lock:
+                    self._index_changes = None
+                return
+            metrics.observe('face_index_train_ms', (time.perf_counter() - start) * 1000)
+            with self._gallery_lock:
+                current = self._gallery
+                for student_id in self._index_changes:
+                    if student_id in current:
+                        index.add([student_id], current.vectors_of([student_id]))
+                    else:
+                        index.remove(student_id)
+                self._index_changes = None
+                if self._use_index(len(current)):
+                    self._index = index
+
+        threading.Thread(target=train, name='face-index-training', daemon=True).start()
+
+    def _forward(self, tensors):
+        """Run preprocessed face tensors through the network in bounded batches."""
+        batch_size = max(1, int(self.settings['FACE_EMBED_BATCH_SIZE']))
+        features = [self.embedder.forward(tensors[start:start + batch_size])
+                    for start in range(0, len(tensors), batch_size)]
+        return np.vstack(features).astype(np.float32)
+
+    def get_face_encodings(self, face_crops):
+        """Embed a list of RGB face crops with batched forward passes.
+
+        Crops are stacked into tensors of at most FACE_EMBED_BATCH_SIZE to
+        bound memory; with the batch scheduler enabled they may share a
+        forward pass with crops from concurrent requests. Returns a
+        (len(face_crops) x D) float32 array.
+        """
+        if not face_crops:
+            return np.zeros((0, 0), dtype=np.float32)
+        tensors = [self.embedder.preprocess(Image.fromarray(crop)) for crop in face_crops]
+        if self.scheduler is not None:
+            return self.scheduler.embed(tensors)
+        return self._forward(tensors)
+
+    def recognize_faces(self, frame, detection_scale=None, detection_upsample=None, session_id=None):
+        """Detect and recognize faces in the frame
+
+        ``detection_scale`` and ``detection_upsample`` override the configured
+        detection resolution, e.g. per room. With a ``session_id`` frames
+        that barely differ from the last processed one return the previous
+        result, and faces are tracked across the session's frames so only new
+        or unconfirmed tracks are embedded and matched.
+        """
+        if not session_id:
+            return self._recognize_faces(frame, detection_scale, detection_upsample)
+
+        session = self.sessions.get(session_id)
+        with session.lock:
+            if session.gate is not None and not session.gate.has_changed(frame):
+                return session.last_result
+            session.last_result = self._recognize_faces(frame, detection_scale, detection_upsample,
+                                                        session.tracker)
+            return session.last_result
+
+    def _recognize_faces(self, frame, detection_scale=None, detection_upsample=None, tracker=None):
+        """Recognition pipeline behind recognize_faces"""
         try:
             # Convert BGR to RGB for dlib
             rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-            # Detect faces using dlib
-            faces = self.face_detector(rgb_frame)
-            
+            # Detect faces using dlib, exactly once per frame
+            faces = self.detect_faces(rgb_frame, detection_scale, detection_upsample)
             if not faces:
                 return []
 
-            # Get all students from database
-            students = Student.query.all()
-            recognized_students = []
+            # Follow faces across frames; only new or unconfirmed tracks are recognized
+            tracks = None
+            pending = list(range(len(faces)))
+            if tracker is not None:
+                tracks = tracker.update([(f.left(), f.top(), f.right(), f.bottom()) for f in faces])
+                pending = [i for i, track in enumerate(tracks) if tracker.needs_recognition(track)]
+            metrics.increment('faces_detected', len(faces))
+            metrics.increment('faces_embedded', len(pending))
 
-            # Process each detected face
-            for face in faces:
-                try:
-                    # Crop and embed the detected face via ResNet50 (or fallback)
-                    x1, y1, x2, y2 = face.left(), face.top(), face.right(), face.bottom()
-                    face_crop = rgb_frame[y1:y2, x1:x2]
-                    face_encoding = self.get_face_encoding(face_crop)
-                    if face_encoding is None:
-                        continue
-
-                    # Compare with student images
-                    for student in students:
-                        try:
-                            if student.image_path:
-                                student_img_path = os.path.join('student_images', student.image_path)
-                                if not os.path.exists(student_img_path):
-                                    continue
-                                    
-                                student_img = self.load_student_image(student_img_path)
-                                if student_img is None:
-                                    continue
-
-                                student_encoding = self.get_face_encoding(student_img)
-                                if student_encoding is not None:
-                                    # Compare face encodings
-                                    distance = np.linalg.norm(face_encoding - student_encoding)
-                                    if distance < 0.4:  # Threshold for face matching
-                                        recognized_students.append({
-                                            'student_id': student.id,
-                                            'name': student.name,
-                                            'confidence': 1.0 - distance,
-                                            'detection_time': datetime.now().strftime('%H:%M:%S')
-                                        })
-                                        break
-                        except Exception as e:
-                            print(f"Error processing student {student.id}: {e}")
-                            continue
-                except Exception as e:
-                    print(f"Error processing face: {e}")
+            matches = [None] * len(faces)
+            if pending:
+                # Embed the pending faces in one batched ResNet50 pass
+                face_crops = self.get_face_crops(rgb_frame, [faces[i] for i in pending])
+                face_encodings = self.get_face_encodings(face_crops)
+
+                # Precomputed student embeddings; no student images are read here
+                gallery = self.get_gallery()
+                if face_encodings.shape[1] == gallery.dimension:
+                    # Score all faces against all students in one matrix multiply
+                    new_matches = gallery.match(face_encodings,
+                                                threshold=self.settings['FACE_MATCH_THRESHOLD'],
+                                                top_k=self.settings['FACE_MATCH_TOP_K'],
+                                                index=self._index)
+                else:
+                    new_matches = [None] * len(pending)
+                for i, match in zip(pending, new_matches):
+                    matches[i] = match
+                    if tracks is not None:
+                        tracks[i].record_match(match, tracker.frame_no)
+
+            # Stable tracks keep the identity they were recognized with
+            if tracks is not None:
+                for i, track in enumerate(tracks):
+                    if matches[i] is None and track.student_id is not None:
+                        matches[i] = {'student_id': track.student_id, 'name': track.name,
+                                      'distance': track.distance, 'margin': None, 'top_k': []}
+
+            # Keep the closest face when several faces match the same student
+            best_by_student = {}
+            for match in matches:
+                student_id = match['student_id'] if match else None
+                if student_id is None:
                     continue
+                if student_id not in best_by_student or match['distance'] < best_by_student[student_id]['distance']:
+                    best_by_student[student_id] = match
+
+            recognized_students = []
+            for student_id, match in best_by_student.items():
+                recognized_students.append({
+                    'student_id': student_id,
+                    'name': match['name'],
+                    'confidence': 1.0 - match['distance'],
+                    'distance': match['distance'],
+                    'margin': match['margin'],
+                    'top_k': match['top_k'],
+                    'detection_time': datetime.now().strftime('%H:%M:%S')
+                })
 
             return recognized_students
 
@@ -0,0 +1,106 @@
+"""
+Per-session face tracking across consecutive frames.
+
+Detections are associated with existing tracks by box overlap, so a face
+that was already identified keeps its identity and skips embedding and
+matching until it is due for re-verification.
+"""
+import itertools
+
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU between two (N x 4) and (M x 4) arrays of x1, y1, x2, y2 boxes."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class Track:
+    """One face followed across frames and the identity assigned to it."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, box, frame_no):
+        self.id = next(self._ids)
+        self.box = box
+        self.student_id = None
+        self.name = None
+        self.distance = None
+        self.confirmations = 0  # Consecutive recognitions agreeing on student_id
+        self.last_recognized = None  # Frame number of the last embedding/matching
+        self.last_seen = frame_no
+
+    def record_match(self, match, frame_no):
+        """Update the identity from a gallery match (or a miss)."""
+        student_id = match['student_id'] if match else None
+        if student_id is not None and student_id == self.student_id:
+            self.confirmations += 1
+        else:
+            self.confirmations = 1 if student_id is not None else 0
+        self.student_id = student_id
+        self.name = match['name'] if match else None
+        self.distance = match['distance'] if match else None
+        self.last_recognized = frame_no
+
+
+class FaceTracker:
+    """IoU tracker that decides which faces of a frame still need recognition."""
+
+    def __init__(self, iou_threshold=0.3, max_missed=5, confirm_hits=2, reverify_every=30, retry_every=3):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.confirm_hits = confirm_hits
+        self.reverify_every = reverify_every
+        self.retry_every = retry_every
+        self.tracks = []
+        self.frame_no = 0
+
+    def update(self, boxes):
+        """Associate this frame's boxes with tracks; returns one track per box."""
+        self.frame_no += 1
+        boxes = [tuple(box) for box in boxes]
+        assigned = [None] * len(boxes)
+
+        if self.tracks and boxes:
+            iou = box_iou([t.box for t in self.tracks], boxes)
+            # Greedy association, highest overlap first
+            for flat in np.argsort(-iou, axis=None):
+                t, b = np.unravel_index(flat, iou.shape)
+                if iou[t, b] < self.iou_threshold:
+                    break
+                track = self.tracks[t]
+                if assigned[b] is None and track.last_seen != self.frame_no:
+                    track.box = boxes[b]
+                    track.last_seen = self.frame_no
+                    assigned[b] = track
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                track = Track(box, self.frame_no)
+                self.tracks.append(track)
+                assigned[b] = track
+
+        self.tracks = [t for t in self.tracks if self.frame_no - t.last_seen <= self.max_missed]
+        return assigned
+
+    def needs_recognition(self, track):
+        """True for new, unconfirmed or due-for-reverification tracks."""
+        if track.last_recognized is None:
+            return True
+        age = self.frame_no - track.last_recognized
+        if track.student_id is None:
+            return age >= self.retry_every
+        if track.confirmations < self.confirm_hits:
+            return True
+        return age >= self.reverify_every
+
@@ -0,0 +1,47 @@
+"""
+Cheap scene-change detection for skipping recognition on static frames.
+"""
+import cv2
+import numpy as np
+
+import metrics
+
+# Size of the grayscale thumbnail frames are compared at
+SIGNATURE_SIZE = (32, 24)
+
+
+def frame_signature(frame):
+    """Downsampled grayscale copy of a BGR frame used for differencing."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class FrameGate:
+    """Decide whether a frame differs enough from the last processed one to recognize it.
+
+    Frames are compared with the last frame that was let through rather than
+    the previous frame, so slow drift still triggers eventually; after
+    ``max_skips`` consecutive skips a frame is let through regardless.
+    """
+
+    def __init__(self, threshold=4.0, max_skips=10):
+        """``threshold`` is the mean absolute grey-level difference (0-255) that counts as a change."""
+        self.threshold = threshold
+        self.max_skips = max_skips
+        self._reference = None
+        self._skips = 0
+
+    def has_changed(self, frame):
+        """True if the frame should be processed; False if the previous result still applies."""
+        signature = frame_signature(frame)
+        if (self._reference is None
+                or self._reference.shape != signature.shape
+                or self._skips >= self.max_skips
+                or np.mean(np.abs(signature - self._reference)) > self.threshold):
+            self._reference = signature
+            self._skips = 0
+            metrics.increment('frames_gate_processed')
+            return True
+        self._skips += 1
+        metrics.increment('frames_gate_skipped')
+        return False
@@ -232,6 +232,10 @@ class AttendanceGUI:
                                 command=self.export_attendance)
         export_btn.grid(row=0, column=4, padx=5, pady=5)
 
+        parquet_btn = ttk.Button(export_controls, text="Export to Parquet",
+                                 command=lambda: self.export_attendance('parquet'))
+        parquet_btn.grid(row=0, column=5, padx=5, pady=5)
+
     def display_frame(self, frame):
         """Display a frame from OpenCV in the GUI."""
         # Convert frame from BGR to RGB
@@ -377,7 +381,7 @@ class AttendanceGUI:
                     row['Time']
                 ))
 
-    def export_attendance(self):
+    def export_attendance(self, export_format='csv'):
         """Export attendance data for a date range."""
         start_date = self.start_date_var.get()
         end_date = self.end_date_var.get()
@@ -391,4 +395,4 @@ class AttendanceGUI:
             return
 
         # Export attendance
-        self.controller.export_attendance(start_date, end_date)
+        self.controller.export_attendance(start_date, end_date, export_format)
@@ -0,0 +1,106 @@
+"""
+Cross-request micro-batching for face embedding.
+
+Concurrent requests hand their preprocessed face tensors to one background
+thread, which waits a few milliseconds for more work, runs a single forward
+pass over everything collected and scatters the embeddings back.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import metrics
+
+
+class _Request:
+    """Tensors submitted by one caller and the slot its result is delivered to."""
+
+    def __init__(self, tensors):
+        self.tensors = tensors
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.submitted = time.perf_counter()
+
+
+class BatchScheduler:
+    """Collect embedding requests into shared batches and run them on one thread."""
+
+    def __init__(self, embed_fn, max_batch_size=32, max_wait_ms=5.0):
+        """``embed_fn`` maps a list of tensors to an (N x D) array of embeddings."""
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='embedding-scheduler', daemon=True)
+        self._thread.start()
+
+    def queue_depth(self):
+        """Number of face tensors waiting for a batch."""
+        with self._condition:
+            return sum(len(r.tensors) for r in self._pending)
+
+    def embed(self, tensors):
+        """Embed a list of tensors, blocking until their batch has run."""
+        if not tensors:
+            return np.zeros((0, 0), dtype=np.float32)
+        request = _Request(tensors)
+        with self._condition:
+            self._pending.append(request)
+            metrics.set_gauge('embedding_queue_depth', sum(len(r.tensors) for r in self._pending))
+            self._condition.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _take_batch(self):
+        """Wait for work, then gather requests until the batch is full or the deadline passes."""
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            deadline = self._pending[0].submitted + self.max_wait
+            size = sum(len(r.tensors) for r in self._pending)
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+                size = sum(len(r.tensors) for r in self._pending)
+
+            # Always take the first request, even if it alone exceeds the batch size
+            batch = [self._pending.popleft()]
+            size = len(batch[0].tensors)
+            while self._pending and size + len(self._pending[0].tensors) <= self.max_batch_size:
+                request = self._pending.popleft()
+                batch.append(request)
+                size += len(request.tensors)
+            metrics.set_gauge('embedding_queue_depth', sum(len(r.tensors) for r in self._pending))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            tensors = [t for request in batch for t in request.tensors]
+            metrics.observe('embedding_batch_size', len(tensors), metrics.SIZE_BUCKETS)
+            metrics.observe('embedding_batch_requests', len(batch), metrics.SIZE_BUCKETS)
+            start = time.perf_counter()
+            try:
+                embeddings = self.embed_fn(tensors)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            metrics.observe('embedding_forward_ms', (time.perf_counter() - start) * 1000)
+
+            offset = 0
+            now = time.perf_counter()
+            for request in batch:
+                request.result = embeddings[offset:offset + len(request.tensors)]
+                offset += len(request.tensors)
+                metrics.observe('embedding_wait_ms', (now - request.submitted) * 1000)
+                request.done.set()
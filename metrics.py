@@ -0,0 +1,57 @@
+"""
+In-process counters, gauges and histograms for the recognition pipeline.
+"""
+import threading
+
+# Default histogram bucket upper bounds
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+TIME_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def increment(name, value=1):
+    """Add to a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """Record the current value of a gauge."""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, value, buckets=TIME_BUCKETS_MS):
+    """Record one observation in a histogram."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1),
+                         'count': 0, 'sum': 0.0, 'max': None}
+            _histograms[name] = histogram
+        slot = next((i for i, bound in enumerate(histogram['buckets']) if value <= bound),
+                    len(histogram['buckets']))
+        histogram['counts'][slot] += 1
+        histogram['count'] += 1
+        histogram['sum'] += value
+        if histogram['max'] is None or value > histogram['max']:
+            histogram['max'] = value
+
+
+def snapshot():
+    """Return a JSON-serializable copy of all metrics."""
+    with _lock:
+        histograms = {}
+        for name, h in _histograms.items():
+            labels = [f"<={bound}" for bound in h['buckets']] + [f">{h['buckets'][-1]}"]
+            histograms[name] = {
+                'buckets': dict(zip(labels, h['counts'])),
+                'count': h['count'],
+                'mean': h['sum'] / h['count'] if h['count'] else None,
+                'max': h['max']
+            }
+        return {'counters': dict(_counters), 'gauges': dict(_gauges), 'histograms': histograms}
@@ -0,0 +1,116 @@
+"""
+Schema upgrades for existing databases.
+
+``db.create_all()`` only creates missing tables, so indexes added to an
+existing model (or widened columns) never reach databases created before
+them. ``upgrade_schema`` brings such databases up to date and is safe to
+run on every start; it works on both SQLite and PostgreSQL.
+"""
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from attendance_rollups import rebuild_if_missing
+from models import Attendance, FaceEmbedding
+
+# Preference when collapsing duplicate attendance rows of one student and day
+STATUS_RANK = {'Present': 0, 'Late': 1, 'Absent': 2}
+
+
+def deduplicate_attendance(session):
+    """Keep one attendance row per (student_id, date); returns the number deleted.
+
+    The kept row is the most present one (Present, then Late, then Absent),
+    and among those the earliest check-in. The caller commits.
+    """
+    duplicated = session.query(Attendance.student_id, Attendance.date) \
+        .group_by(Attendance.student_id, Attendance.date) \
+        .having(func.count(Attendance.id) > 1).all()
+    deleted = 0
+    for student_id, date in duplicated:
+        rows = Attendance.query.filter_by(student_id=student_id, date=date).all()
+        rows.sort(key=lambda a: (STATUS_RANK.get(a.status, 3), a.time_in is None, a.time_in or 0, a.id))
+        for row in rows[1:]:
+            session.delete(row)
+            deleted += 1
+    return deleted
+
+
+# String columns whose declared length grew after databases were created
+WIDENED_COLUMNS = [FaceEmbedding.__table__.c.model_version]
+
+
+def widen_columns(database):
+    """Grow VARCHAR columns shorter than their model declares; returns the names altered.
+
+    Only PostgreSQL is altered: SQLite does not enforce VARCHAR lengths.
+    """
+    engine = database.engine
+    if engine.dialect.name != 'postgresql':
+        return []
+    inspector = inspect(engine)
+    altered = []
+    for column in WIDENED_COLUMNS:
+        table = column.table.name
+        current = {c['name']: c['type'] for c in inspector.get_columns(table)}.get(column.name)
+        length = getattr(current, 'length', None)
+        if length is not None and length < column.type.length:
+            type_sql = column.type.compile(dialect=engine.dialect)
+            database.session.execute(text(f'ALTER TABLE {table} ALTER COLUMN {column.name} TYPE {type_sql}'))
+            altered.append(f'{table}.{column.name}')
+    database.session.commit()
+    return altered
+
+
+def upgrade_schema(database):
+    """Widen grown columns, create the attendance indexes that are missing (removing
+    duplicates first) and backfill the rollups."""
+    engine = database.engine
+    indexes = Attendance.__table__.indexes
+    try:
+        for name in widen_columns(database):
+            print(f"Widened column {name}")
+        deleted = deduplicate_attendance(database.session)
+        database.session.commit()
+        if deleted:
+            print(f"Removed {deleted} duplicate attendance record(s)")
+        for index in sorted(indexes, key=lambda i: i.name):
+            index.create(bind=engine, checkfirst=True)
+        rebuild_if_missing()
+    except SQLAlchemyError as e:
+        # Another worker may be running the same upgrade concurrently
+        database.session.rollback()
+        print(f"Error upgrading database schema: {e}")
+
+
+# Representative attendance queries and the index each one should use
+QUERY_PLAN_CHECKS = [
+    ('attendance by date', 'ix_attendance_date',
+     "SELECT * FROM attendance WHERE date = :date"),
+    ('attendance by student and date', 'uq_attendance_student_date',
+     "SELECT * FROM attendance WHERE student_id = :student_id AND date = :date"),
+    ('attendance history of a student', 'uq_attendance_student_date',
+     "SELECT * FROM attendance WHERE student_id = :student_id ORDER BY date DESC"),
+]
+
+
+def explain(database, sql, params):
+    """Return the query plan of a statement as text lines."""
+    dialect = database.engine.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    rows = database.session.execute(text(prefix + sql), params).fetchall()
+    # SQLite returns (id, parent, notused, detail); PostgreSQL a single text column
+    return [str(row[-1]) for row in rows]
+
+
+def check_query_plans(database):
+    """Explain the attendance queries; returns (name, expected index, used, plan) tuples.
+
+    PostgreSQL may prefer a sequential scan on small tables, so an unused
+    index there is only meaningful once the table has grown.
+    """
+    params = {'date': '2000-01-01', 'student_id': 0}
+    results = []
+    for name, index, sql in QUERY_PLAN_CHECKS:
+        plan = explain(database, sql, params)
+        results.append((name, index, any(index in line for line in plan), plan))
+    return results
@@ -13,6 +13,8 @@ class Student(db.Model):
     image_path = db.Column(db.String(255), nullable=True)
 
     attendances = db.relationship('Attendance', backref='student', lazy=True)
+    embeddings = db.relationship('FaceEmbedding', backref='student', lazy=True,
+                                 cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Student {self.student_id}: {self.name}>'
@@ -27,5 +29,51 @@ class Attendance(db.Model):
     status = db.Column(db.String(20), default="Present")  # Present, Late, Absent
     notes = db.Column(db.Text, nullable=True)
 
+    # One record per student and day; the unique index also serves lookups by
+    # student. Existing databases get these from migrations.upgrade_schema.
+    __table_args__ = (
+        db.Index('uq_attendance_student_date', 'student_id', 'date', unique=True),
+        db.Index('ix_attendance_date', 'date'),
+    )
+
+    def __repr__(self):
+        return f'<Attendance {self.student_id} on {self.date}>'
+
+
+class StudentAttendanceSummary(db.Model):
+    """Running attendance totals of one student, maintained by attendance_rollups."""
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StudentAttendanceSummary {self.student_id}: {self.total}>'
+
+
+class DailyAttendanceSummary(db.Model):
+    """Attendance counts of one day, maintained by attendance_rollups."""
+    date = db.Column(db.Date, primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyAttendanceSummary {self.date}: {self.total}>'
+
+
+class FaceEmbedding(db.Model):
+    """Precomputed gallery embedding of a student's image for one model version."""
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    model_version = db.Column(db.String(128), nullable=False)  # Widened by migrations.upgrade_schema
+    image_path = db.Column(db.String(255), nullable=False)  # Image the vector was computed from
+    vector = db.Column(db.LargeBinary, nullable=False)  # float32 bytes
+    updated_at = db.Column(db.DateTime, default=get_current_datetime, onupdate=get_current_datetime)
+
+    __table_args__ = (db.UniqueConstraint('student_id', 'model_version'),)
+
     def __repr__(self):
-        return f'<Attendance {self.student_id} on {self.date}>'
\ No newline at end of file
+        return f'<FaceEmbedding {self.student_id} ({self.model_version})>'
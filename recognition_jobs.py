@@ -0,0 +1,144 @@
+"""
+Local job queue and worker pool for face recognition requests.
+
+Request threads only enqueue the encoded frame; decoding, recognition and
+the attendance writes run on a fixed pool of worker threads. The queue is
+bounded per session by dropping that session's oldest waiting frames.
+
+A session's jobs run one at a time and in the order they were submitted,
+so per-session state such as the face tracker sees frames in order; other
+sessions' jobs are picked up meanwhile.
+"""
+import threading
+import time
+import uuid
+from collections import deque
+
+import metrics
+
+
+class Job:
+    """One queued recognition request and its outcome."""
+
+    def __init__(self, session_key, payload):
+        self.id = uuid.uuid4().hex
+        self.session_key = session_key
+        self.payload = payload
+        self.status = 'queued'  # queued, running, done, failed, dropped
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished (or was dropped); True if it did within the timeout."""
+        return self._done.wait(timeout)
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished = time.monotonic()
+        self._done.set()
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status}
+        if self.status == 'done':
+            data.update(self.result or {})
+        elif self.error:
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """FIFO recognition queue served by a pool of worker threads."""
+
+    def __init__(self, process_job, workers=2, max_pending_per_session=2, max_pending=64, result_ttl=120):
+        """``process_job(job)`` returns the job's result dict or raises."""
+        self.process_job = process_job
+        self.max_pending_per_session = max(1, max_pending_per_session)
+        self.max_pending = max(1, max_pending)
+        self.result_ttl = result_ttl
+        self._pending = deque()
+        self._running_sessions = set()
+        self._jobs = {}
+        self._condition = threading.Condition()
+        self._workers = [threading.Thread(target=self._run, name=f'recognition-worker-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+    def _drop(self, job):
+        self._pending.remove(job)
+        job.finish('dropped', error='Superseded by a newer frame')
+        metrics.increment('recognition_jobs_dropped')
+
+    def _forget_finished(self):
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.result_ttl:
+                del self._jobs[job_id]
+
+    def submit(self, session_key, payload, max_pending_per_session=None):
+        """Queue a job, dropping the session's oldest waiting jobs beyond its limit.
+
+        ``max_pending_per_session`` overrides the queue's limit for this
+        session, e.g. 1 to keep only the newest frame of a stream.
+        """
+        job = Job(session_key, payload)
+        limit = max(1, max_pending_per_session or self.max_pending_per_session)
+        with self._condition:
+            self._forget_finished()
+            waiting = [j for j in self._pending if j.session_key == session_key]
+            for old in waiting[:max(0, len(waiting) + 1 - limit)]:
+                self._drop(old)
+            while len(self._pending) >= self.max_pending:
+                self._drop(self._pending[0])
+            self._pending.append(job)
+            self._jobs[job.id] = job
+            metrics.set_gauge('recognition_queue_length', len(self._pending))
+            self._condition.notify()
+        return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def _next_job(self):
+        """Oldest waiting job of a session that has no job running, or None."""
+        for job in self._pending:
+            if job.session_key not in self._running_sessions:
+                return job
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+                self._pending.remove(job)
+                self._running_sessions.add(job.session_key)
+                job.status = 'running'
+                job.started = time.monotonic()
+                metrics.set_gauge('recognition_queue_length', len(self._pending))
+            metrics.observe('recognition_job_wait_ms', (job.started - job.submitted) * 1000)
+            try:
+                result = self.process_job(job)
+                job.finish('done', result=result)
+            except Exception as e:
+                print(f"Error in recognition job {job.id}: {e}")
+                job.finish('failed', error=str(e))
+            finally:
+                with self._condition:
+                    self._running_sessions.discard(job.session_key)
+                    # The session's next job may be waiting for any idle worker
+                    self._condition.notify_all()
+            metrics.observe('recognition_job_processing_ms', (job.finished - job.started) * 1000)
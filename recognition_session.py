@@ -0,0 +1,154 @@
+"""
+Per-session state of the recognition pipeline.
+
+A session is one camera stream (e.g. one open mark page). It keeps the face
+tracker, the frame-change gate and the last result between frames.
+Streaming sessions additionally keep the attendance date and the students
+already marked, queue frames as they arrive and push recognition events
+back to the browser.
+"""
+import queue
+import threading
+import time
+import uuid
+
+import metrics
+from face_tracker import FaceTracker
+from frame_gate import FrameGate
+
+
+class RecognitionSession:
+    """State carried between the frames of one camera stream."""
+
+    def __init__(self, session_id, tracker=None, gate=None):
+        self.id = session_id
+        self.tracker = tracker
+        self.gate = gate
+        self.last_result = []
+        self.lock = threading.Lock()  # Held while a frame of this session is processed
+
+
+class SessionRegistry:
+    """Recognition sessions keyed by id, expired after a period of inactivity."""
+
+    def __init__(self, ttl_seconds=300, tracking=True, gating=True, tracker_options=None, gate_options=None):
+        self.ttl = ttl_seconds
+        self.tracking = tracking
+        self.gating = gating
+        self.tracker_options = tracker_options or {}
+        self.gate_options = gate_options or {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the session with this id, creating it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, seen) in self._sessions.items() if now - seen > self.ttl]
+            for key in expired:
+                del self._sessions[key]
+            session = self._sessions.get(session_id, (None, None))[0]
+            if session is None:
+                session = RecognitionSession(
+                    session_id,
+                    tracker=FaceTracker(**self.tracker_options) if self.tracking else None,
+                    gate=FrameGate(**self.gate_options) if self.gating else None
+                )
+            self._sessions[session_id] = (session, now)
+            metrics.set_gauge('recognition_sessions', len(self._sessions))
+            return session
+
+
+class StreamSession:
+    """A long-lived recognition session fed with frames and read as a stream of events.
+
+    Frames are recognized on the shared recognition job queue, one at a
+    time and in order. Only the newest waiting frame is kept: if the
+    workers fall behind, older frames are dropped instead of queueing up.
+    """
+
+    def __init__(self, session_id, selected_date, marked, submit_job):
+        """``submit_job(session, image_bytes)`` queues a frame and returns its job."""
+        self.id = session_id
+        self.selected_date = selected_date
+        self.marked = set(marked)  # Student ids already marked for selected_date
+        self.submit_job = submit_job
+        self.last_activity = time.monotonic()
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.closed = False
+        self._job = None
+        self._lock = threading.Lock()
+        self._events = queue.Queue()
+
+    def submit_frame(self, image_bytes):
+        """Queue a new frame, replacing any frame of this session still waiting."""
+        with self._lock:
+            self.last_activity = time.monotonic()
+            self.frames_received += 1
+            if self._job is not None and self._job.status == 'queued':
+                self.frames_dropped += 1
+                metrics.increment('stream_frames_dropped')
+            self._job = self.submit_job(self, image_bytes)
+
+    def push_event(self, event):
+        self._events.put(event)
+
+    def events(self, keepalive_seconds=15):
+        """Yield events as they happen; yields None when idle so callers can send keepalives."""
+        while not self.closed:
+            try:
+                yield self._events.get(timeout=keepalive_seconds)
+            except queue.Empty:
+                yield None
+            self.last_activity = time.monotonic()
+
+    def close(self):
+        self.closed = True
+        self._events.put({'type': 'closed'})
+
+
+class StreamRegistry:
+    """Open streaming sessions of this process, closed after a period of inactivity.
+
+    Every session's event stream holds a server thread while it is open, so
+    at most ``max_streams`` sessions are open at once.
+    """
+
+    def __init__(self, ttl_seconds=300, max_streams=16):
+        self.ttl = ttl_seconds
+        self.max_streams = max(1, max_streams)
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id, stream in list(self._streams.items()):
+            if now - stream.last_activity > self.ttl:
+                stream.close()
+                del self._streams[session_id]
+
+    def create(self, selected_date, marked, submit_job):
+        """Open a new streaming session and return it, or None if too many are open."""
+        with self._lock:
+            self._expire()
+            if len(self._streams) >= self.max_streams:
+                return None
+            stream = StreamSession(uuid.uuid4().hex, selected_date, marked, submit_job)
+            self._streams[stream.id] = stream
+            metrics.set_gauge('stream_sessions', len(self._streams))
+            return stream
+
+    def get(self, session_id):
+        """Return an open session, or None."""
+        with self._lock:
+            self._expire()
+            return self._streams.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            stream = self._streams.pop(session_id, None)
+            metrics.set_gauge('stream_sessions', len(self._streams))
+        if stream is not None:
+            stream.close()
+        return stream is not None
@@ -1,22 +1,31 @@
 import os
 import csv
+import json
 import base64
-import uuid
+import zlib
+import click
 import cv2
 import numpy as np
-from face_recognizer import FaceRecognizer
+from face_recognizer import get_face_recognizer
 from io import StringIO
 from datetime import timedelta, datetime
-import pandas as pd
-from io import BytesIO
-import openpyxl.utils
 
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, Response
-from sqlalchemy import func
+from flask import abort, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, Response, stream_with_context
+from sqlalchemy import and_, func, insert, or_, select, update
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
+import metrics
 from app import app, db
-from models import Student, Attendance
+from attendance_export import (COLUMNAR_FORMATS, attendance_matrix, attendance_record_batches,
+                               stream_attendance_columnar, write_attendance_columnar, write_attendance_workbook)
+from attendance_rollups import dialect_insert, forget_student, rebuild as rebuild_rollups, record_changes
+from migrations import check_query_plans, upgrade_schema
+from models import Student, Attendance, DailyAttendanceSummary, StudentAttendanceSummary
+from recognition_jobs import JobQueue
+from recognition_session import StreamRegistry
+from student_images import (VARIANT_SIZES, decode_image, encode_jpeg, image_key, limit_size, remove_image,
+                            stored_filename, variant_path, write_variants)
 from utils import get_current_datetime, format_date, format_time, parse_date, KOLKATA_TZ, localize_datetime
 
 # Configure upload folder
@@ -28,17 +37,58 @@ def allowed_file(filename):
     """Check if the file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Stored images never change under the same name, so they can be cached for a year
+IMAGE_MAX_AGE = 365 * 24 * 3600
+# Longest side of the copy that faces are detected on when cropping the face variant
+FACE_CROP_DETECTION_SIDE = 640
+
+def generate_image_variants(filename):
+    """Write the thumbnail and face-crop variants of a stored image; False if it cannot be decoded"""
+    folder = app.config['UPLOAD_FOLDER']
+    image = cv2.imread(os.path.join(folder, filename))
+    if image is None:
+        return False
+
+    face_box = None
+    try:
+        scale = min(1.0, FACE_CROP_DETECTION_SIDE / max(image.shape[:2]))
+        faces = get_face_recognizer(db).detect_faces(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), scale=scale,
+                                                     backend='inline')
+        if faces:
+            face = max(faces, key=lambda f: f.area())
+            face_box = (face.left(), face.top(), face.right(), face.bottom())
+    except Exception as e:
+        print(f"Error detecting face for image variants of {filename}: {e}")
+
+    write_variants(folder, filename, image, face_box)
+    return True
+
+def store_image(image_data, filename):
+    """Save image bytes to the uploads directory, with their variants, under a content-hashed name"""
+    unique_filename = stored_filename(image_data, filename)
+    # Ensure the upload folder exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+    with open(file_path, 'wb') as f:
+        f.write(image_data)
+    try:
+        generate_image_variants(unique_filename)
+    except Exception as e:
+        # The image route generates missing variants on first request
+        print(f"Error generating image variants: {e}")
+    return unique_filename
+
+def remove_stored_image(filename):
+    """Delete a stored image and its variants without failing the surrounding request"""
+    try:
+        remove_image(app.config['UPLOAD_FOLDER'], filename)
+    except Exception as e:
+        print(f"Error removing student image: {e}")
+
 def save_image_file(file):
     """Save an uploaded file to the uploads directory"""
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Add a UUID to make the filename unique
-        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-        # Ensure the upload folder exists
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
-        return unique_filename
+        return store_image(file.read(), secure_filename(file.filename))
     return None
 
 def save_base64_image(base64_data):
@@ -51,23 +101,89 @@ def save_base64_image(base64_data):
         # Decode base64 data
         image_data = base64.b64decode(base64_data)
 
-        # Generate a unique filename
-        unique_filename = f"{uuid.uuid4().hex}_webcam.jpg"
-
-        # Ensure the upload folder exists
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-        # Save the image
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        with open(file_path, 'wb') as f:
-            f.write(image_data)
+        # Webcam captures come at whatever size the browser produced
+        image = decode_image(image_data)
+        if image is None:
+            print("Error saving base64 image: not a decodable image")
+            return None
+        resized = limit_size(image)
+        if resized is not image:
+            image_data = encode_jpeg(resized, quality=90)
 
-        return unique_filename
+        return store_image(image_data, 'webcam.jpg')
     except Exception as e:
         print(f"Error saving base64 image: {e}")
         return None
 
 
+@app.template_global()
+def student_image_url(student, variant='thumb'):
+    """URL of a student's image or one of its variants, or None without an image"""
+    if not student.image_path:
+        return None
+    return url_for('student_image', variant=variant, filename=student.image_path)
+
+def update_student_embedding(student):
+    """Store the student's gallery embedding without failing the surrounding request"""
+    try:
+        get_face_recognizer(db).enroll_student(student)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error computing face embedding for student {student.id}: {e}")
+
+
+@app.cli.command('embed-gallery')
+@click.option('--prune', is_flag=True, help='Delete embeddings of other model versions afterwards.')
+def embed_gallery_command(prune):
+    """Compute missing or outdated gallery embeddings for all students."""
+    recognizer = get_face_recognizer(db)
+    count = recognizer.backfill_gallery()
+    print(f"Embedded {count} student image(s) for model {recognizer.model_version}")
+    if prune:
+        removed = recognizer.prune_gallery()
+        db.session.commit()
+        print(f"Removed {removed} embedding(s) of other model versions")
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Deduplicate attendance and create missing indexes on an existing database."""
+    upgrade_schema(db)
+    print("Database schema is up to date")
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the per-student and per-day attendance rollups from the records."""
+    rebuild_rollups()
+    print("Attendance rollups rebuilt")
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Show whether the attendance queries use their indexes."""
+    failed = False
+    for name, index, used, plan in check_query_plans(db):
+        print(f"{'ok' if used else 'NO INDEX':8s} {name} (expects {index})")
+        for line in plan:
+            print(f"         {line}")
+        failed = failed or not used
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command('fit-projection')
+@click.option('--dimension', type=int, default=None, help='Target dimension (defaults to FACE_EMBEDDING_DIM).')
+def fit_projection_command(dimension):
+    """Fit the PCA projection of the embeddings on the current gallery."""
+    dimension = dimension or app.config['FACE_EMBEDDING_DIM'] or 128
+    path, fitted = get_face_recognizer(db).fit_projection(dimension)
+    print(f"Saved a {fitted}-d projection to {path}")
+    if fitted < dimension:
+        print(f"Only {fitted} components could be fitted; enroll more students for {dimension}")
+
+
 # Home route
 @app.route('/')
 def index():
@@ -77,8 +193,9 @@ def index():
 # Student routes
 @app.route('/students')
 def list_students():
-    students = Student.query.all()
-    return render_template('students/list.html', students=students)
+    # Students are loaded page by page from /api/students
+    total_students = db.session.query(func.count(Student.id)).scalar()
+    return render_template('students/list.html', total_students=total_students)
 
 
 @app.route('/students/add', methods=['GET', 'POST'])
@@ -137,6 +254,9 @@ def add_student():
         db.session.add(new_student)
         db.session.commit()
 
+        # Compute the gallery embedding once, at enrollment time
+        update_student_embedding(new_student)
+
         flash('Student added successfully!', 'success')
         return redirect(url_for('list_students'))
 
@@ -146,8 +266,9 @@ def add_student():
 @app.route('/students/<int:id>')
 def view_student(id):
     student = Student.query.get_or_404(id)
-    attendances = Attendance.query.filter_by(student_id=student.id).order_by(Attendance.date.desc()).all()
-    return render_template('students/view.html', student=student, attendances=attendances)
+    # Counts come from the rollup; the history is loaded page by page from the API
+    summary = db.session.get(StudentAttendanceSummary, student.id)
+    return render_template('students/view.html', student=student, summary=summary)
 
 
 @app.route('/students/<int:id>/edit', methods=['GET', 'POST'])
@@ -187,18 +308,17 @@ def edit_student(id):
                 image_filename = save_image_file(image_file)
 
         if image_filename:
-            # Delete old image file if it exists
+            # Delete old image file and its variants if it exists
             if student.image_path:
-                old_image_path = os.path.join(app.config['UPLOAD_FOLDER'], student.image_path)
-                if os.path.exists(old_image_path):
-                    try:
-                        os.remove(old_image_path)
-                    except Exception as e:
-                        print(f"Error removing old image: {e}")
+                remove_stored_image(student.image_path)
 
             student.image_path = image_filename
 
         db.session.commit()
+
+        # Recompute the gallery embedding only if the image changed
+        update_student_embedding(student)
+
         flash('Student updated successfully!', 'success')
         return redirect(url_for('view_student', id=student.id))
 
@@ -211,16 +331,12 @@ def delete_student(id):
 
     try:
         # First delete all attendance records related to this student
+        forget_student(student.id)
         Attendance.query.filter_by(student_id=student.id).delete()
 
-        # Delete student image if it exists
+        # Delete student image and its variants if it exists
         if student.image_path:
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], student.image_path)
-            if os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                except Exception as e:
-                    print(f"Error removing student image: {e}")
+            remove_stored_image(student.image_path)
 
         # Now delete the student
         db.session.delete(student)
@@ -235,6 +351,116 @@ def delete_student(id):
     return redirect(url_for('list_students'))
 
 
+# Page sizes of the paginated listing endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+RECENT_ACTIVITY_LIMIT = 20
+
+
+def page_limit():
+    """Page size requested with ?limit=, clamped to MAX_PAGE_SIZE"""
+    return max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+
+def search_students(query, text):
+    """Filter a Student query by a case-insensitive match on name or student ID"""
+    text = (text or '').strip()
+    if not text:
+        return query
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = f'%{escaped}%'
+    return query.filter(or_(Student.name.ilike(pattern, escape='\\'),
+                            Student.student_id.ilike(pattern, escape='\\')))
+
+
+def student_summary(student):
+    return {
+        "id": student.id,
+        "student_id": student.student_id,
+        "name": student.name,
+        "email": student.email,
+        "image_url": student_image_url(student),
+        "view_url": url_for('view_student', id=student.id),
+        "edit_url": url_for('edit_student', id=student.id),
+        "delete_url": url_for('delete_student', id=student.id)
+    }
+
+
+@app.route('/api/students')
+def api_students():
+    """One page of students, optionally filtered by ?q=; keyset-paginated on id with ?after="""
+    limit = page_limit()
+    query = search_students(Student.query, request.args.get('q'))
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(Student.id > after)
+    students = query.order_by(Student.id).limit(limit + 1).all()
+
+    page = students[:limit]
+    return jsonify({
+        "students": [student_summary(student) for student in page],
+        "next_cursor": page[-1].id if len(students) > limit else None
+    })
+
+
+@app.route('/api/students/<int:id>/attendance')
+def api_student_history(id):
+    """One page of a student's attendance, newest first; keyset-paginated on date with ?before="""
+    student = Student.query.get_or_404(id)
+    limit = page_limit()
+    query = Attendance.query.filter(Attendance.student_id == student.id)
+    before = request.args.get('before')
+    if before:
+        try:
+            query = query.filter(Attendance.date < parse_date(before).date())
+        except ValueError:
+            return jsonify({"error": "Invalid date format"}), 400
+    records = query.order_by(Attendance.date.desc()).limit(limit + 1).all()
+
+    page = records[:limit]
+    return jsonify({
+        "attendance_records": [{
+            "id": record.id,
+            "date": format_date(record.date),
+            "status": record.status,
+            "time_in": record.time_in.strftime('%H:%M:%S') if record.time_in else None
+        } for record in page],
+        "next_cursor": format_date(page[-1].date) if len(records) > limit else None
+    })
+
+
+@app.route('/api/attendance_sheet')
+def api_attendance_sheet():
+    """One page of students with their attendance on ?date=, filtered by ?q=; keyset-paginated on id"""
+    try:
+        selected_date = parse_date(request.args.get('date', '')).date()
+    except ValueError:
+        return jsonify({"error": "Invalid date format"}), 400
+
+    limit = page_limit()
+    query = db.session.query(Student, Attendance).outerjoin(
+        Attendance, and_(Attendance.student_id == Student.id, Attendance.date == selected_date))
+    query = search_students(query, request.args.get('q'))
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(Student.id > after)
+    rows = query.order_by(Student.id).limit(limit + 1).all()
+
+    page = rows[:limit]
+    return jsonify({
+        "date": format_date(selected_date),
+        "students": [{
+            "id": student.id,
+            "student_id": student.student_id,
+            "name": student.name,
+            "status": attendance.status if attendance else None,
+            "time_in": attendance.time_in.strftime('%H:%M:%S') if attendance and attendance.time_in else None,
+            "time_in_display": attendance.time_in.strftime('%I:%M:%S %p') if attendance and attendance.time_in else None
+        } for student, attendance in page],
+        "next_cursor": page[-1][0].id if len(rows) > limit else None
+    })
+
+
 # Attendance routes
 @app.route('/attendance')
 def attendance():
@@ -245,15 +471,19 @@ def attendance():
     except ValueError:
         selected_date = today
 
-    # Get all students
-    students = Student.query.all()
-
-    # Get attendance for selected date
-    attendances = {a.student_id: a for a in Attendance.query.filter_by(date=selected_date).all()}
+    # The sheet itself is loaded page by page from /api/attendance_sheet
+    total_students = db.session.query(func.count(Student.id)).scalar()
+    day = db.session.get(DailyAttendanceSummary, selected_date)
+    recent_activity = db.session.query(Attendance, Student.name) \
+        .join(Student, Student.id == Attendance.student_id) \
+        .filter(Attendance.date == selected_date, Attendance.time_in.isnot(None)) \
+        .order_by(Attendance.time_in.desc()).limit(RECENT_ACTIVITY_LIMIT).all()
 
     return render_template('attendance/mark.html',
-                          students=students,
-                          attendances=attendances,
+                          total_students=total_students,
+                          present_count=day.present if day else 0,
+                          late_count=day.late if day else 0,
+                          recent_activity=recent_activity,
                           selected_date=selected_date)
 
 
@@ -277,11 +507,17 @@ def mark_attendance():
     print(f"Processing attendance for date: {date}")
     print(f"Number of students: {len(student_ids)}")
 
-    # Get all existing attendance records for this date to avoid completely overwriting them
+    # Get all existing attendance records for this date to avoid completely overwriting them.
+    # They stay locked until the commit, so the rollup deltas use the status being replaced.
     existing_records = {}
-    for record in Attendance.query.filter_by(date=date).all():
+    for record in Attendance.query.filter_by(date=date).order_by(Attendance.id).with_for_update().all():
         existing_records[record.student_id] = record
 
+    # (student_id, date, old status, new status) for the attendance rollups
+    status_changes = []
+    # Records to create, inserted together once all students are processed
+    new_rows = []
+
     # Process each student's attendance
     for i, student_id in enumerate(student_ids):
         student_id = int(student_id)  # Ensure integer type
@@ -312,6 +548,7 @@ def mark_attendance():
 
             # Update the status always
             record.status = status
+            status_changes.append((student_id, date, old_status, status))
 
             # Handle time_in field - only update in specific cases
             if status in ['Present', 'Late']:
@@ -399,15 +636,13 @@ def mark_attendance():
                     print(f"New record with current time for student {student_id}")
 
             # Create the new record
-            record = Attendance(
-                student_id=student_id,
-                date=date,
-                status=status,
-                time_in=time_in
-            )
-            db.session.add(record)
-            print(f"Created new record for student {student_id}: status={status}, time_in={time_in}")
+            new_rows.append({'student_id': student_id, 'date': date, 'status': status, 'time_in': time_in})
+            print(f"Creating new record for student {student_id}: status={status}, time_in={time_in}")
+
+    if new_rows:
+        status_changes.extend(insert_manual_attendance(new_rows))
 
+    record_changes(status_changes)
     db.session.commit()
     flash('Attendance marked successfully!', 'success')
     return redirect(url_for('attendance', date=date_str))
@@ -415,16 +650,18 @@ def mark_attendance():
 
 @app.route('/attendance/report')
 def attendance_report():
-    students = Student.query.all()
+    # Per-student counts from the incrementally maintained rollup
+    summary = StudentAttendanceSummary
+    rows = db.session.query(
+        Student,
+        func.coalesce(summary.total, 0),
+        func.coalesce(summary.present, 0),
+        func.coalesce(summary.late, 0),
+        func.coalesce(summary.absent, 0)
+    ).outerjoin(summary, summary.student_id == Student.id).order_by(Student.id).all()
 
-    # Calculate attendance statistics for each student
     stats = []
-    for student in students:
-        total = Attendance.query.filter_by(student_id=student.id).count()
-        present = Attendance.query.filter_by(student_id=student.id, status='Present').count()
-        late = Attendance.query.filter_by(student_id=student.id, status='Late').count()
-        absent = Attendance.query.filter_by(student_id=student.id, status='Absent').count()
-
+    for student, total, present, late, absent in rows:
         stats.append({
             'student': student,
             'total': total,
@@ -492,16 +729,205 @@ def api_student_attendance():
         }
     })
 
+# Content types accepted as a raw encoded frame in the request body
+BINARY_FRAME_MIMETYPES = {'application/octet-stream', 'image/jpeg', 'image/png', 'image/webp'}
+
+
+def decode_frame(image_bytes):
+    """Decode encoded image bytes (JPEG, PNG, ...) into a BGR frame, or None"""
+    if not image_bytes:
+        return None
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def read_request_image_bytes():
+    """Read the encoded image of a recognition request without decoding it.
+
+    Accepts raw image bytes in the body, a multipart upload in the 'frame'
+    field (e.g. a Blob from canvas.toBlob), or the legacy JSON body with a
+    base64 data URL in 'image'. Returns (image bytes, error message).
+    """
+    if request.mimetype in BINARY_FRAME_MIMETYPES:
+        # Read straight from the request stream without base64 or JSON
+        image_bytes = request.stream.read()
+        return (image_bytes, None) if image_bytes else (None, "No image data provided")
+
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('frame')
+        if upload is None:
+            return None, "No image data provided"
+        return upload.read(), None
+
+    data = request.get_json(silent=True)
+    if not data or 'image' not in data:
+        return None, "No image data provided"
+    try:
+        image_data = data['image'].split(',')[1] if ',' in data['image'] else data['image']
+        return base64.b64decode(image_data), None
+    except Exception as e:
+        print(f"Error decoding image: {e}")
+        return None, "Failed to process image data"
+
+
+def insert_new_attendance(rows):
+    """Insert attendance rows, skipping any another worker inserted concurrently
+
+    Returns the student ids whose rows were actually inserted.
+    """
+    # A consistent order keeps concurrent inserts of overlapping rows from deadlocking
+    rows = sorted(rows, key=lambda row: (row['date'], row['student_id']))
+    stmt = dialect_insert(Attendance)
+    if stmt is None:
+        db.session.execute(insert(Attendance), rows)
+        return {row['student_id'] for row in rows}
+    stmt = stmt.on_conflict_do_nothing(index_elements=['student_id', 'date']).returning(Attendance.student_id)
+    return set(db.session.execute(stmt, rows).scalars())
+
+
+def insert_manual_attendance(rows):
+    """Insert manually marked attendance rows; returns their rollup status changes
+
+    A row whose (student_id, date) was inserted concurrently, e.g. by face
+    recognition, updates that record instead: the manual status wins, and
+    an existing check-in time is kept for Present/Late.
+    """
+    inserted = insert_new_attendance(rows)
+    changes = [(row['student_id'], row['date'], None, row['status']) for row in rows
+               if row['student_id'] in inserted]
+    conflicting = {row['student_id']: row for row in rows if row['student_id'] not in inserted}
+    if not conflicting:
+        return changes
+
+    date = next(iter(conflicting.values()))['date']
+    for record in Attendance.query.filter(Attendance.date == date, Attendance.student_id.in_(conflicting)) \
+            .order_by(Attendance.id).with_for_update().all():
+        row = conflicting[record.student_id]
+        changes.append((record.student_id, date, record.status, row['status']))
+        record.status = row['status']
+        if row['status'] == 'Absent':
+            record.time_in = None
+        elif record.time_in is None:
+            record.time_in = row['time_in']
+    return changes
+
+
+def record_recognized_attendance(recognized_faces, selected_date):
+    """Mark recognized students present for a date
+
+    Returns (newly marked students, settled ids): the settled ids are the
+    students now marked for the date, newly or already. A student whose
+    record another writer inserted concurrently is in neither. Database
+    errors are rolled back and re-raised.
+
+    Uses a constant number of statements per frame: one SELECT of the
+    existing rows, one bulk INSERT, one bulk UPDATE and the rollup upserts.
+    Names come from the recognizer's gallery rather than the student table.
+    """
+    names = {face['student_id']: face['name'] for face in recognized_faces if face.get('student_id') is not None}
+    if not names:
+        return [], set()
+
+    # Locked until the commit, so a concurrent manual mark cannot change a
+    # status between reading it and recording its rollup delta
+    existing = {attendance.student_id: attendance for attendance in db.session.query(
+        Attendance.id, Attendance.student_id, Attendance.status
+    ).filter(Attendance.date == selected_date, Attendance.student_id.in_(names))
+        .order_by(Attendance.id).with_for_update().all()}
+
+    current_time = get_current_datetime().time()
+    new_rows, updated_rows = [], []
+    for student_id in names:
+        attendance = existing.get(student_id)
+        if attendance and attendance.status != 'Absent':
+            continue
+        if attendance:
+            updated_rows.append({'id': attendance.id, 'status': 'Present', 'time_in': current_time})
+        else:
+            new_rows.append({'student_id': student_id, 'date': selected_date,
+                             'status': 'Present', 'time_in': current_time})
+
+    try:
+        inserted = insert_new_attendance(new_rows) if new_rows else set()
+        if updated_rows:
+            db.session.execute(update(Attendance), updated_rows)
+        updated = {existing_id for existing_id, attendance in existing.items()
+                   if attendance.status == 'Absent'}
+        record_changes([(student_id, selected_date, None, 'Present') for student_id in inserted] +
+                       [(student_id, selected_date, 'Absent', 'Present') for student_id in updated])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error recording attendance for recognized faces: {e}")
+        raise
+
+    already_marked = {student_id for student_id, attendance in existing.items() if attendance.status != 'Absent'}
+    recognized_students = [{
+        "id": student_id,
+        "name": names[student_id],
+        "detection_time": current_time.strftime('%H:%M:%S')
+    } for student_id in names if student_id in inserted or student_id in updated]
+    return recognized_students, inserted | updated | already_marked
+
+
+def run_recognition_job(job):
+    """Decode, recognize and record attendance for one queued frame (runs on a worker thread)"""
+    if 'stream' in job.payload:
+        return run_stream_job(job.payload['stream'], job.payload['image_bytes'])
+
+    frame = decode_frame(job.payload['image_bytes'])
+    if frame is None:
+        raise ValueError("Invalid image data")
+
+    with app.app_context():
+        recognized_faces = get_face_recognizer(db).recognize_faces(
+            frame,
+            detection_scale=job.payload['detection_scale'],
+            detection_upsample=job.payload['detection_upsample'],
+            session_id=job.payload['session_id']
+        )
+        if not recognized_faces:
+            return {"recognized_students": []}
+        recognized_students, _ = record_recognized_attendance(recognized_faces, job.payload['date'])
+        return {"recognized_students": recognized_students}
+
+
+# Per-request detection overrides may only make detection cheaper than a
+# full-resolution frame; larger values would let one request exhaust memory or CPU
+MAX_DETECTION_UPSAMPLE = 2
+
+
+def detection_overrides():
+    """Validated detection_scale/detection_upsample query overrides as (scale, upsample, error)"""
+    scale = request.args.get('detection_scale', type=float)
+    upsample = request.args.get('detection_upsample', type=int)
+    if 'detection_scale' in request.args and not (scale is not None and 0 < scale <= 1):
+        return None, None, "detection_scale must be greater than 0 and at most 1"
+    if 'detection_upsample' in request.args and not (upsample is not None and
+                                                     0 <= upsample <= MAX_DETECTION_UPSAMPLE):
+        return None, None, f"detection_upsample must be an integer from 0 to {MAX_DETECTION_UPSAMPLE}"
+    return scale, upsample, None
+
+
+# Recognition requests are served by a dedicated pool instead of the request threads
+recognition_jobs = JobQueue(
+    run_recognition_job,
+    workers=app.config['RECOGNITION_WORKERS'],
+    max_pending_per_session=app.config['RECOGNITION_QUEUE_PER_SESSION'],
+    max_pending=app.config['RECOGNITION_QUEUE_MAX']
+)
+
+
 @app.route('/api/recognize_faces', methods=['POST'])
 def recognize_faces():
-    """API endpoint for face recognition"""
+    """API endpoint for face recognition
+
+    The frame may be sent as raw JPEG bytes (application/octet-stream), as a
+    multipart 'frame' upload, or as JSON with a base64 data URL. The frame is
+    queued for the recognition workers; the response waits up to ``wait``
+    seconds (RECOGNITION_WAIT_SECONDS by default, 0 with ``async=1``) and
+    otherwise returns 202 with a job id to fetch from /api/recognition_jobs.
+    """
     try:
-        # Get image data from request
-        data = request.get_json()
-        if not data or 'image' not in data:
-            print("No image data provided in request")
-            return jsonify({"error": "No image data provided"}), 400
-
         # Get the selected date from the request
         selected_date_str = request.args.get('date')
         try:
@@ -510,78 +936,178 @@ def recognize_faces():
             print(f"Invalid date format: {selected_date_str}")
             selected_date = get_current_datetime().date()
 
-        # Convert base64 to image
-        try:
-            image_data = data['image'].split(',')[1] if ',' in data['image'] else data['image']
-            image_bytes = base64.b64decode(image_data)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            if frame is None:
-                print("Failed to decode image data")
-                return jsonify({"error": "Invalid image data"}), 400
-        except Exception as e:
-            print(f"Error decoding image: {e}")
-            return jsonify({"error": "Failed to process image data"}), 400
-
-        # Initialize face recognizer and recognize faces
-        try:
-            face_recognizer = FaceRecognizer(db)
-            recognized_faces = face_recognizer.recognize_faces(frame)
+        detection_scale, detection_upsample, error = detection_overrides()
+        if error:
+            return jsonify({"error": error}), 400
+
+        # Get image data from request
+        image_bytes, error = read_request_image_bytes()
+        if image_bytes is None:
+            print(f"Could not read frame from request: {error}")
+            return jsonify({"error": error}), 400
+
+        session_id = request.args.get('session_id')
+        job = recognition_jobs.submit(session_id or request.remote_addr, {
+            'image_bytes': image_bytes,
+            'date': selected_date,
+            'session_id': session_id,
+            'detection_scale': detection_scale,
+            'detection_upsample': detection_upsample
+        })
 
-            if recognized_faces:
-                recognized_students = []
+        wait = 0 if request.args.get('async') == '1' else app.config['RECOGNITION_WAIT_SECONDS']
+        wait = request.args.get('wait', wait, type=float)
+        if not job.wait(min(max(wait, 0), app.config['RECOGNITION_WAIT_SECONDS'])):
+            return jsonify(job.to_dict()), 202
 
-                for face in recognized_faces:
-                    try:
-                        # Check if student is already marked present for the selected date
-                        attendance = Attendance.query.filter_by(
-                            student_id=face['student_id'],
-                            date=selected_date
-                        ).first()
-
-                        if not attendance or attendance.status == 'Absent':
-                            student = Student.query.get(face['student_id'])
-                            if student:
-                                # Get current time in the correct timezone
-                                current_time = get_current_datetime().time()
-                                
-                                recognized_students.append({
-                                    "id": student.id,
-                                    "name": student.name,
-                                    "detection_time": current_time.strftime('%H:%M:%S')
-                                })
-
-                                # Create or update attendance record
-                                if not attendance:
-                                    attendance = Attendance(
-                                        student_id=student.id,
-                                        date=selected_date,
-                                        status='Present',
-                                        time_in=current_time
-                                    )
-                                    db.session.add(attendance)
-                                else:
-                                    attendance.status = 'Present'
-                                    attendance.time_in = current_time
-
-                    except Exception as e:
-                        print(f"Error processing recognized face: {e}")
-                        continue
-
-                db.session.commit()
-                return jsonify({"recognized_students": recognized_students})
-
-            return jsonify({"recognized_students": []})
-
-        except Exception as e:
-            print(f"Error in face recognition process: {e}")
-            return jsonify({"error": "Face recognition failed"}), 500
+        if job.status == 'failed':
+            status_code = 400 if job.error == "Invalid image data" else 500
+            return jsonify({"job_id": job.id, "error": job.error}), status_code
+        return jsonify(job.to_dict()), 200 if job.status == 'done' else 409
 
     except Exception as e:
         print(f"Unexpected error in face recognition endpoint: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+
+@app.route('/api/recognition_jobs/<job_id>')
+def recognition_job(job_id):
+    """API endpoint to fetch the status and result of a queued recognition job"""
+    job = recognition_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+# Streaming recognition sessions of this process. Sessions (like recognition
+# jobs and the loaded models) are in-memory, so the app must run as a single
+# process; the Procfile starts one gunicorn worker with many threads and
+# moves face detection to a process pool (see README).
+recognition_streams = StreamRegistry(max_streams=app.config['RECOGNITION_MAX_STREAMS'])
+
+
+def submit_stream_frame(stream, image_bytes):
+    """Queue a frame of a streaming session, replacing its frame still waiting"""
+    return recognition_jobs.submit(stream.id, {'stream': stream, 'image_bytes': image_bytes},
+                                   max_pending_per_session=1)
+
+
+def run_stream_job(stream, image_bytes):
+    """Recognize a queued stream frame and push its events to the stream"""
+    if stream.closed:
+        return {"events": 0}
+    try:
+        events = process_stream_frame(stream, image_bytes)
+    except Exception:
+        stream.push_event({'type': 'error', 'message': 'Face recognition failed'})
+        raise
+    for event in events:
+        stream.push_event(event)
+    return {"events": len(events)}
+
+
+def process_stream_frame(stream, image_bytes):
+    """Recognize one frame of a streaming session and return the events to push"""
+    frame = decode_frame(image_bytes)
+    if frame is None:
+        return [{'type': 'error', 'message': 'Invalid image data'}]
+
+    with app.app_context():
+        recognized_faces = get_face_recognizer(db).recognize_faces(frame, session_id=stream.id)
+        # Students already marked in this session need no database work
+        new_faces = [face for face in recognized_faces if face['student_id'] not in stream.marked]
+        if not new_faces:
+            return []
+        # Raises on a database error, leaving these students to be retried on the next frame
+        recognized_students, settled = record_recognized_attendance(new_faces, stream.selected_date)
+
+    # Whether newly marked or already present in the database, these are done
+    stream.marked.update(settled)
+    if not recognized_students:
+        return []
+    return [{'type': 'recognized', 'recognized_students': recognized_students}]
+
+
+@app.route('/api/recognition_sessions', methods=['POST'])
+def create_recognition_session():
+    """Open a streaming recognition session for a date"""
+    data = request.get_json(silent=True) or {}
+    date_str = data.get('date') or request.args.get('date')
+    try:
+        selected_date = parse_date(date_str).date() if date_str else get_current_datetime().date()
+    except ValueError:
+        return jsonify({"error": "Invalid date format"}), 400
+
+    marked = [a.student_id for a in Attendance.query.filter(
+        Attendance.date == selected_date,
+        Attendance.status != 'Absent'
+    ).all()]
+    stream = recognition_streams.create(selected_date, marked, submit_stream_frame)
+    if stream is None:
+        # Keep threads free for other requests; the page falls back to polling
+        return jsonify({"error": "Too many open recognition sessions"}), 503
+    return jsonify({
+        "session_id": stream.id,
+        "date": format_date(selected_date),
+        "frames_url": url_for('submit_session_frame', session_id=stream.id),
+        "events_url": url_for('recognition_session_events', session_id=stream.id)
+    }), 201
+
+
+@app.route('/api/recognition_sessions/<session_id>/frames', methods=['POST'])
+def submit_session_frame(session_id):
+    """Queue a raw encoded frame for a streaming session; stale frames are dropped"""
+    stream = recognition_streams.get(session_id)
+    if stream is None:
+        return jsonify({"error": "Session not found"}), 404
+    image_bytes = request.stream.read()
+    if not image_bytes:
+        return jsonify({"error": "No image data provided"}), 400
+    stream.submit_frame(image_bytes)
+    return jsonify({"frames_received": stream.frames_received, "frames_dropped": stream.frames_dropped}), 202
+
+
+@app.route('/api/recognition_sessions/<session_id>/events')
+def recognition_session_events(session_id):
+    """Server-sent events with the students recognized in a streaming session"""
+    stream = recognition_streams.get(session_id)
+    if stream is None:
+        return jsonify({"error": "Session not found"}), 404
+
+    def generate():
+        try:
+            yield 'retry: 2000\n\n'
+            for event in stream.events():
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # Runs when the client disconnects too (at the next write), so the
+            # session's worker thread does not linger until the TTL expires
+            recognition_streams.close(session_id)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/recognition_sessions/<session_id>', methods=['DELETE'])
+def close_recognition_session(session_id):
+    """Close a streaming recognition session"""
+    if not recognition_streams.close(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify({"closed": True})
+
+
+@app.route('/api/recognition_metrics')
+def api_recognition_metrics():
+    """API endpoint exposing recognition pipeline metrics for tuning"""
+    recognizer = get_face_recognizer(db)
+    data = metrics.snapshot()
+    data['gauges']['recognition_queue_length'] = len(recognition_jobs)
+    if recognizer.scheduler is not None:
+        data['gauges']['embedding_queue_depth'] = recognizer.scheduler.queue_depth()
+    return jsonify(data)
+
 @app.route('/api/date_attendance')
 def api_date_attendance():
     """API endpoint to get attendance data for all students on a specific date"""
@@ -613,11 +1139,12 @@ def api_date_attendance():
             "time_in": format_time(attendance.time_in) if attendance and attendance.time_in else None
         })
 
-    # Calculate summary stats
-    present = sum(1 for record in records if record['status'] == 'Present')
-    late = sum(1 for record in records if record['status'] == 'Late')
-    absent = sum(1 for record in records if record['status'] == 'Absent')
+    # Summary stats from the daily rollup; students without a record count as absent
+    day = db.session.get(DailyAttendanceSummary, selected_date)
+    present = day.present if day else 0
+    late = day.late if day else 0
     total = len(records)
+    absent = total - present - late
 
     return jsonify({
         "date": date_str,
@@ -632,6 +1159,91 @@ def api_date_attendance():
     })
 
 
+# Attendance rows fetched per database round-trip while streaming exports
+EXPORT_CHUNK_ROWS = 1000
+
+
+def stream_attendance_csv(start_date, end_date, compress=False):
+    """Yield the detailed attendance CSV for a date range in chunks, optionally gzip-compressed"""
+    rows = db.session.query(
+        Attendance.date, Student.student_id, Student.name, Attendance.status,
+        Attendance.time_in, Attendance.time_out, Attendance.notes
+    ).join(Student, Student.id == Attendance.student_id).filter(
+        Attendance.date >= start_date,
+        Attendance.date <= end_date
+    ).order_by(Attendance.date, Attendance.id).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+
+    # wbits=31 writes a gzip container instead of a raw zlib stream
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Date', 'Student ID', 'Student Name', 'Status', 'Time In', 'Time Out', 'Notes'])
+
+    def flush():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    for count, (date, student_id, name, status, time_in, time_out, notes) in enumerate(rows, 1):
+        writer.writerow([
+            format_date(date),
+            student_id,
+            name,
+            status,
+            format_time(time_in) if time_in else '',
+            format_time(time_out) if time_out else '',
+            notes or ''
+        ])
+        if count % EXPORT_CHUNK_ROWS == 0:
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+# Rows per Parquet row group / Arrow record batch in columnar exports
+COLUMNAR_CHUNK_ROWS = 65536
+
+
+def attendance_columnar_batches(start_date, end_date):
+    """Arrow record batches of the attendance records in a date range"""
+    roster = db.session.query(Student.id, Student.student_id, Student.name).order_by(Student.id).all()
+    rows = db.session.execute(
+        select(Attendance.student_id, Attendance.date, Attendance.status,
+               Attendance.time_in, Attendance.time_out, Attendance.notes)
+        .join(Student, Student.id == Attendance.student_id)
+        .where(Attendance.date >= start_date, Attendance.date <= end_date)
+        .order_by(Attendance.date, Attendance.id)
+        .execution_options(yield_per=COLUMNAR_CHUNK_ROWS)
+    )
+    return attendance_record_batches(roster, rows.partitions())
+
+
+@app.cli.command('archive-attendance')
+@click.option('--month', default=None, help='Month to archive as YYYY-MM (defaults to last month).')
+@click.option('--format', 'export_format', type=click.Choice(sorted(COLUMNAR_FORMATS)), default='arrow')
+def archive_attendance_command(month, export_format):
+    """Write a month of attendance to the on-disk columnar archive (run it periodically, e.g. from cron)."""
+    if month:
+        start_date = datetime.strptime(month, '%Y-%m').date()
+    else:
+        start_date = (get_current_datetime().date().replace(day=1) - timedelta(days=1)).replace(day=1)
+    end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+    archive_dir = app.config['ATTENDANCE_ARCHIVE_DIR']
+    os.makedirs(archive_dir, exist_ok=True)
+    extension, _ = COLUMNAR_FORMATS[export_format]
+    path = os.path.join(archive_dir, f"attendance_{start_date.strftime('%Y-%m')}{extension}")
+    count = write_attendance_columnar(attendance_columnar_batches(start_date, end_date), path, export_format)
+    print(f"Archived {count} attendance record(s) to {path}")
+
+
 @app.route('/attendance/export', methods=['GET', 'POST'])
 def export_attendance():
     if request.method == 'POST':
@@ -646,62 +1258,16 @@ def export_attendance():
             flash('Please enter valid dates', 'danger')
             return redirect(url_for('export_attendance'))
 
-        # Query attendance data for the date range
-        attendances = Attendance.query.filter(
-            Attendance.date >= start_date,
-            Attendance.date <= end_date
-        ).order_by(Attendance.date).all()
-
-        # Get all students
-        students = {student.id: student for student in Student.query.all()}
-
         if export_format == 'excel':
-            # Create a DataFrame with dates as columns
-            dates = pd.date_range(start=start_date, end=end_date, freq='D')
-            df = pd.DataFrame(index=[student.student_id for student in students.values()])
-            
-            # Initialize all cells as empty
-            for date in dates:
-                df[date.strftime('%Y-%m-%d')] = ''
-
-            # Fill in the attendance data
-            for attendance in attendances:
-                student = students.get(attendance.student_id)
-                if student:
-                    date_str = attendance.date.strftime('%Y-%m-%d')
-                    time_str = attendance.time_in.strftime('%H:%M:%S') if attendance.time_in else ''
-                    status = attendance.status
-                    row_index = student.student_id
-                    df.at[row_index, date_str] = time_str
-
-            # Create Excel file in memory
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Attendance', index_label='Student ID')
-                # Auto-adjust column widths
-                worksheet = writer.sheets['Attendance']
-                
-                # Set width for Student ID column
-                worksheet.column_dimensions['A'].width = 15
-                
-                # Set width for date columns
-                for idx, col in enumerate(df.columns):
-                    col_letter = openpyxl.utils.get_column_letter(idx + 2)
-                    worksheet.column_dimensions[col_letter].width = 12
-                
-                # Format the header row
-                header_font = openpyxl.styles.Font(bold=True)
-                for cell in worksheet[1]:
-                    cell.font = header_font
-                    cell.alignment = openpyxl.styles.Alignment(horizontal='center')
-                
-                # Format the data cells
-                for row in worksheet.iter_rows(min_row=2):
-                    for cell in row:
-                        cell.alignment = openpyxl.styles.Alignment(horizontal='center')
+            # Check-in times for the range, pivoted into a students x dates matrix
+            rows = db.session.query(Student.student_id, Attendance.date, Attendance.time_in) \
+                .join(Student, Student.id == Attendance.student_id) \
+                .filter(Attendance.date >= start_date, Attendance.date <= end_date).all()
+            student_ids = [student_id for (student_id,) in
+                           db.session.query(Student.student_id).order_by(Student.id)]
+            output = write_attendance_workbook(attendance_matrix(rows, student_ids, start_date, end_date))
 
             # Prepare response
-            output.seek(0)
             filename = f"attendance_{start_date_str}_to_{end_date_str}.xlsx"
             return Response(
                 output,
@@ -709,37 +1275,29 @@ def export_attendance():
                 headers={"Content-Disposition": f"attachment;filename={filename}"}
             )
         elif export_format == 'csv':
-            # Create CSV file in memory
-            output = StringIO()
-            writer = csv.writer(output)
-
-            # Write header
-            writer.writerow(['Date', 'Student ID', 'Student Name', 'Status', 'Time In', 'Time Out', 'Notes'])
-
-            # Write data
-            for attendance in attendances:
-                student = students.get(attendance.student_id)
-                if student:
-                    writer.writerow([
-                        format_date(attendance.date),
-                        student.student_id,
-                        student.name,
-                        attendance.status,
-                        format_time(attendance.time_in) if attendance.time_in else '',
-                        format_time(attendance.time_out) if attendance.time_out else '',
-                        attendance.notes or ''
-                    ])
-
-            # Prepare response
-            output.seek(0)
-            filename = f"attendance_{start_date_str}_to_{end_date_str}.csv"
+            # Stream the CSV so memory stays flat however long the range is
+            compress = request.form.get('compress') == '1'
+            filename = f"attendance_{start_date_str}_to_{end_date_str}.csv" + ('.gz' if compress else '')
             return Response(
-                output,
-                mimetype="text/csv",
+                stream_with_context(stream_attendance_csv(start_date, end_date, compress)),
+                mimetype="application/gzip" if compress else "text/csv",
+                headers={"Content-Disposition": f"attachment;filename={filename}"}
+            )
+        elif export_format in COLUMNAR_FORMATS:
+            try:
+                batches = attendance_columnar_batches(start_date, end_date)
+            except ImportError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('export_attendance'))
+            extension, mimetype = COLUMNAR_FORMATS[export_format]
+            filename = f"attendance_{start_date_str}_to_{end_date_str}{extension}"
+            return Response(
+                stream_with_context(stream_attendance_columnar(batches, export_format)),
+                mimetype=mimetype,
                 headers={"Content-Disposition": f"attachment;filename={filename}"}
             )
         else:
-            flash('Only CSV and Excel export formats are currently supported', 'info')
+            flash('Only CSV, Excel, Parquet and Arrow export formats are currently supported', 'info')
             return redirect(url_for('export_attendance'))
 
     # Default dates: last 30 days
@@ -753,10 +1311,49 @@ def export_attendance():
     )
 
 
-# Create static folder for student images
+@app.route('/student-images/<any(original, thumb, face):variant>/<path:filename>')
+def student_image(variant, filename):
+    """Serve a student image or one of its variants with long-lived cache headers"""
+    folder = app.config.get('UPLOAD_FOLDER', 'student_images')
+    original = safe_join(folder, filename)
+    if original is None or not os.path.isfile(original):
+        abort(404)
+
+    directory, name = folder, filename
+    if variant != 'original':
+        path = variant_path(folder, variant, filename)
+        # Images stored before variants existed get them on first request
+        if os.path.isfile(path) or generate_image_variants(filename):
+            directory, name = os.path.split(path)
+        else:
+            # OpenCV cannot decode it (e.g. a GIF): serve the original instead
+            variant = 'original'
+
+    response = send_from_directory(directory, name, etag=f'{variant}-{image_key(filename)}',
+                                   max_age=IMAGE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+
+# Older links to original images
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config.get('UPLOAD_FOLDER', 'student_images'), filename)
+    return student_image('original', filename)
+
+
+@app.cli.command('generate-image-variants')
+def generate_image_variants_command():
+    """Write missing thumbnail and face-crop variants of the stored student images."""
+    folder = app.config['UPLOAD_FOLDER']
+    generated = skipped = 0
+    for (filename,) in db.session.query(Student.image_path).filter(Student.image_path.isnot(None)):
+        if all(os.path.isfile(variant_path(folder, variant, filename)) for variant in VARIANT_SIZES):
+            continue
+        if os.path.isfile(os.path.join(folder, filename)) and generate_image_variants(filename):
+            generated += 1
+        else:
+            skipped += 1
+    print(f"Generated variants of {generated} image(s); skipped {skipped} missing or unreadable image(s)")
 
 
 # Error handlers
@@ -0,0 +1,118 @@
+"""
+Stored student images and their resized variants.
+
+Uploads are saved under a name that starts with a digest of their content
+and are never rewritten in place; a new photo always gets a new name. The
+name therefore identifies the bytes behind every URL of the image, so the
+image and its variants can be cached by browsers indefinitely.
+
+Each image gets two square JPEG variants, written once when it is stored:
+a small thumbnail for listings and a larger crop around the face for the
+profile page.
+"""
+import hashlib
+import os
+import uuid
+
+import cv2
+import numpy as np
+
+# Longest side of stored webcam captures
+MAX_IMAGE_SIDE = 1280
+# Variant edge lengths: twice their largest on-page size, for high-density screens
+VARIANT_SIZES = {'thumb': 128, 'face': 320}
+# Margin around the face box in the face variant, as a fraction of the box size
+FACE_MARGIN = 0.4
+JPEG_QUALITY = 85
+VARIANTS_DIR = 'variants'
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def stored_filename(data, filename):
+    """Name for a new upload: its content digest, then a random tag so each upload owns its file."""
+    return f"{content_digest(data)}_{uuid.uuid4().hex[:8]}_{filename}"
+
+
+def image_key(filename):
+    """Cache key of a stored image: the digest (or, for older uploads, the UUID) its name starts with."""
+    return filename.split('_', 1)[0]
+
+
+def variant_path(folder, variant, filename):
+    return os.path.join(folder, VARIANTS_DIR, variant, os.path.splitext(filename)[0] + '.jpg')
+
+
+def decode_image(data):
+    """Decode image bytes to a BGR array, or None if OpenCV cannot read them."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode image as JPEG")
+    return buffer.tobytes()
+
+
+def limit_size(image, max_side=MAX_IMAGE_SIDE):
+    """Downscale an image so its longest side is at most ``max_side``."""
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return image
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def square_crop(image, box=None, margin=FACE_MARGIN):
+    """Square of the image centred on a (left, top, right, bottom) box, or the centre square.
+
+    The box is widened by ``margin`` on every side; the square is shifted
+    and shrunk as needed to stay inside the image.
+    """
+    height, width = image.shape[:2]
+    if box is None:
+        center_x, center_y, side = width / 2, height / 2, min(width, height)
+    else:
+        left, top, right, bottom = box
+        center_x, center_y = (left + right) / 2, (top + bottom) / 2
+        side = max(right - left, bottom - top) * (1 + 2 * margin)
+    side = max(int(min(side, width, height)), 1)
+    x = int(min(max(center_x - side / 2, 0), width - side))
+    y = int(min(max(center_y - side / 2, 0), height - side))
+    return image[y:y + side, x:x + side]
+
+
+def _write_atomically(path, data):
+    # Variants may be generated by several workers at once; readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.{uuid.uuid4().hex[:8]}.partial"
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def write_variants(folder, filename, image, face_box=None):
+    """Write the thumbnail and face-crop variants of a stored BGR image.
+
+    Without a face box the face variant falls back to the centre square.
+    """
+    crops = {'thumb': square_crop(image), 'face': square_crop(image, face_box)}
+    for variant, size in VARIANT_SIZES.items():
+        crop = crops[variant]
+        interpolation = cv2.INTER_AREA if crop.shape[0] > size else cv2.INTER_CUBIC
+        resized = cv2.resize(crop, (size, size), interpolation=interpolation)
+        _write_atomically(variant_path(folder, variant, filename), encode_jpeg(resized))
+
+
+def remove_image(folder, filename):
+    """Delete a stored image and its variants, ignoring files that are already gone."""
+    for path in [os.path.join(folder, filename),
+                 *(variant_path(folder, variant, filename) for variant in VARIANT_SIZES)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# Configure the app before it is first imported: an in-memory database and no model warm-up
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("FACE_MODEL_WARMUP", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app():
+    from app import app as flask_app, db
+
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
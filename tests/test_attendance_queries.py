@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+# The routes import the face recognizer, which needs the full ML stack
+pytest.importorskip("dlib")
+pytest.importorskip("torch")
+
+from app import db  # noqa: E402
+from attendance_rollups import record_changes  # noqa: E402
+from migrations import check_query_plans  # noqa: E402
+from models import Attendance, Student  # noqa: E402
+
+
+def add_students(count):
+    students = [Student(student_id=f"S{i:04d}", name=f"Student {i}") for i in range(count)]
+    db.session.add_all(students)
+    db.session.flush()
+    day = date(2025, 1, 6)
+    for i, student in enumerate(students):
+        # Leave every third student without attendance, so no rollup row either
+        if i % 3 == 2:
+            continue
+        status = 'Present' if i % 3 == 0 else 'Late'
+        db.session.add(Attendance(student_id=student.id, date=day, status=status))
+        record_changes([(student.id, day, None, status)])
+    db.session.commit()
+
+
+def count_selects(client, url):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    return statements
+
+
+@pytest.mark.parametrize("count", [1, 25])
+def test_attendance_report_runs_one_query(client, count):
+    add_students(count)
+    db.session.expire_all()
+
+    statements = count_selects(client, "/attendance/report")
+
+    assert len(statements) == 1, statements
+
+
+def test_attendance_report_counts(client):
+    add_students(3)
+
+    response = client.get("/attendance/report")
+
+    body = response.get_data(as_text=True)
+    assert "Student 0" in body and "Student 2" in body
+    assert "100.0%" in body and "0.0%" in body
+
+
+def test_attendance_queries_use_their_indexes(app):
+    results = check_query_plans(db)
+
+    assert results
+    unused = [(name, index, plan) for name, index, used, plan in results if not used]
+    assert not unused